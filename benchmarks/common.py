@@ -0,0 +1,89 @@
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+
+# Linear-interpolated percentile of a list of numbers (None for an empty list)
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "mean": sum(values) / len(values) if values else None,
+        "min": min(values) if values else None,
+        "max": max(values) if values else None,
+    }
+
+
+# Peak resident set size of this process in bytes
+def max_rss_bytes() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(), "git_commit": commit}
+
+
+def write_results(path: str, results: dict) -> None:
+    results = {**results, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "environment": environment()}
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+
+
+# Metrics that got worse than the baseline by more than `tolerance` (relative) and `min_delta` (absolute)
+# Both result files hold {"metrics": {name: number}}; higher is worse for every metric
+def compare_results(current: dict, baseline: dict, tolerance: float = 0.2, min_delta: float = 0.005) -> list:
+    regressions = []
+    for name, value in current.get("metrics", {}).items():
+        before = baseline.get("metrics", {}).get(name)
+        if value is None or before is None:
+            continue
+        if value > before * (1 + tolerance) and value - before > min_delta:
+            regressions.append({"metric": name, "baseline": before, "current": value, "change": (value - before) / before if before else None})
+    return regressions
+
+
+def print_table(rows: list, columns: list) -> None:
+    widths = [max(len(str(column)), *(len(_fmt(row.get(column))) for row in rows)) for column in columns]
+    print("  ".join(str(column).ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(_fmt(row.get(column)).ljust(width) for column, width in zip(columns, widths)))
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    return "-" if value is None else str(value)
+
+
+# Print regressions against a baseline file and return the process exit code (1 when something regressed)
+def report_regressions(current: dict, baseline_path: str, tolerance: float, min_delta: float) -> int:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare_results(current, baseline, tolerance, min_delta)
+    if not regressions:
+        print(f"\nNo regressions against {baseline_path} (tolerance {tolerance:.0%})")
+        return 0
+    print(f"\nRegressions against {baseline_path} (tolerance {tolerance:.0%}):")
+    print_table(regressions, ["metric", "baseline", "current", "change"])
+    return 1
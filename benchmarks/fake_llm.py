@@ -0,0 +1,92 @@
+import json
+import random
+import re
+import threading
+import time
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from src.retrieval import count_tokens
+
+QUESTION_PATTERN = re.compile(r"QUESTION:\s*##\s*(.*?)\s*##", re.DOTALL)
+ANALYSIS_PATTERN = re.compile(r"total (\w+) by (\w+) in (\w+)", re.IGNORECASE)
+
+
+# Benchmark questions the fake LLM knows how to answer: "total <amount> by <category> in <table>"
+def benchmark_questions(spec: dict, count: int) -> list:
+    questions = []
+    for table, cols in spec.items():
+        amounts = [name for name, _ in cols if name.startswith("amount")]
+        categories = [name for name, _ in cols if name.startswith("category")]
+        if amounts and categories:
+            questions.append(f"What is the total {amounts[0]} by {categories[0]} in {table}?")
+    return (questions * (count // max(len(questions), 1) + 1))[:count] if questions else []
+
+
+class FakeLLM:
+    """Prompt-aware stand-in for the chat model with configurable latency and injected failures.
+
+    error_rate raises from the model call (an API failure); bad_sql_rate returns SQL with an unknown
+    column so the self-correction loop has work to do. Prompt tokens are counted for every call.
+    """
+
+    def __init__(self, spec: dict, schema: str = "sales", latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, bad_sql_rate: float = 0.0, seed: int = 0):
+        self.spec = spec
+        self.schema = schema
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bad_sql_rate = bad_sql_rate
+        self.calls = 0
+        self.prompt_tokens = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def chat_model(self, model: str = "fake", temperature: float = 0, **_):
+        return BenchmarkChatModel(llm=self)
+
+    def _sql(self, question: str, broken: bool) -> str:
+        match = ANALYSIS_PATTERN.search(question or "")
+        if not match or match.group(3) not in self.spec:
+            return "SELECT 1 AS answer"
+        amount, category, table = match.groups()
+        if broken:
+            amount = f"{amount}_typo"
+        parent = f"entity_{int(table.split('_')[-1]) - 1}"
+        join = f"\nJOIN {self.schema}.{parent} p ON t.{parent}_id = p.id" if parent in self.spec else ""
+        return (f"SELECT t.{category}, SUM(t.{amount}) AS total, COUNT(*) AS row_count\n"
+                f"FROM {self.schema}.{table} t{join}\nGROUP BY t.{category}\nORDER BY total DESC")
+
+    def respond(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += count_tokens(prompt)
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.error_rate
+            broken = self._rng.random() < self.bad_sql_rate
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("Injected LLM failure")
+        question = QUESTION_PATTERN.search(prompt)
+        question = question.group(1) if question else ""
+        if "fix the error" in prompt:
+            return f"```sql\n{self._sql(question, broken=False)}\n```"
+        if "Create a valid SQL query" in prompt or "WITH clause" in prompt:
+            return f"```sql\n{self._sql(question, broken)}\n```"
+        if "business_questions" in prompt:
+            return "```json\n" + json.dumps({"business_questions": benchmark_questions(self.spec, 3)}) + "\n```"
+        return "erDiagram"
+
+
+class BenchmarkChatModel(BaseChatModel):
+    llm: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "sqlgen-benchmark"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.llm.respond(prompt)))])
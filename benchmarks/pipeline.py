@@ -0,0 +1,164 @@
+"""End-to-end pipeline benchmark against a local SQLite warehouse and a fake LLM.
+
+    python -m benchmarks.pipeline --tables 8 --columns 12 --rows 20000 --iterations 5 --output pipeline.json
+    python -m benchmarks.pipeline ... --compare pipeline.json   # exit code 1 on regressions
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.common import max_rss_bytes, print_table, report_regressions, summarize, write_results
+
+STAGES = ["metadata", "schema_summary", "prune_schema", "generate_sql", "correct_sql", "execute"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=8, help="tables in the generated schema")
+    parser.add_argument("--columns", type=int, default=12, help="columns per table")
+    parser.add_argument("--rows", type=int, default=20000, help="rows per table")
+    parser.add_argument("--questions", type=int, default=3, help="questions answered per iteration")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--cache", choices=["cold", "warm"], default="cold",
+                        help="cold clears every cache before each iteration; warm measures after one unmeasured warm-up")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="probability a fake LLM call raises")
+    parser.add_argument("--bad-sql-rate", type=float, default=0.0, help="probability generated SQL needs a repair")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true", help="also record the Python heap peak (slows every stage)")
+    parser.add_argument("--workdir", help="directory for the dataset and caches (a temporary directory by default)")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run; exit 1 when a metric regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slack before a metric counts as regressed")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="absolute slack (seconds / tokens / bytes)")
+    return parser.parse_args(argv)
+
+
+def _timed(samples: dict, errors: dict, tokens: dict, llm, stage: str, fn):
+    before = llm.prompt_tokens
+    start = time.perf_counter()
+    try:
+        return fn()
+    except Exception:
+        errors[stage] += 1
+        raise
+    finally:
+        samples[stage].append(time.perf_counter() - start)
+        tokens[stage].append(llm.prompt_tokens - before)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sqlgen-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    # the app reads its settings from the environment, so point it at the local stand-ins before importing it
+    os.environ["SQLGEN_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["SQLGEN_DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'session.db')}"
+    os.environ["SQLGEN_LLM_CACHE_BACKEND"] = "none" if args.cache == "cold" else "memory"
+
+    import streamlit as st
+    from streamlit.logger import set_log_level
+    # bare-mode (no `streamlit run`) warnings on every cached function would drown the report
+    st.get_option("logger.level")
+    set_log_level("error")
+    from src import utils
+    from src.result_cache import ResultCache, set_result_cache
+    from benchmarks.fake_llm import FakeLLM, benchmark_questions
+    from benchmarks.warehouse import LocalWarehouse
+
+    warehouse = LocalWarehouse(os.path.join(workdir, "warehouse.db"))
+    build_start = time.perf_counter()
+    spec = warehouse.build(args.tables, args.columns, args.rows, args.seed)
+    build_seconds = time.perf_counter() - build_start
+    warehouse.attach()
+    utils.set_warehouse_query(warehouse.query)
+    llm = FakeLLM(spec, warehouse.schema, args.llm_latency, args.llm_jitter, args.llm_error_rate, args.bad_sql_rate, args.seed)
+    utils.set_chat_model_factory(llm.chat_model)
+    questions = benchmark_questions(spec, args.questions)
+
+    samples = {stage: [] for stage in STAGES}
+    tokens = {stage: [] for stage in STAGES}
+    errors = {stage: 0 for stage in STAGES}
+    repairs, statuses, heap_peaks = [], {}, []
+
+    def reset_caches():
+        st.cache_data.clear()
+        utils.get_schema_summary_cache().invalidate()
+        set_result_cache(ResultCache())
+
+    def run_iteration(record: bool):
+        target = (samples, errors, tokens) if record else ({s: [] for s in STAGES}, {s: 0 for s in STAGES}, {s: [] for s in STAGES})
+        timed = lambda stage, fn: _timed(*target, llm, stage, fn)
+        try:
+            metadata = timed("metadata", utils.fetch_table_metadata)
+            tables = metadata[metadata["schema"] == warehouse.schema]["tableName"].tolist()
+            pieces = timed("schema_summary", lambda: utils.summarize_table_pieces(warehouse.catalog, warehouse.schema, tables))
+        except Exception:
+            return
+        for question in questions:
+            try:
+                schema_text = timed("prune_schema", lambda: utils.relevant_table_schema(question, pieces)[0])
+                sql = timed("generate_sql", lambda: utils.extract_code_block(utils.generate_initial_sql(question, schema_text), "sql"))
+                correction = timed("correct_sql", lambda: utils.correct_sql_with_budget(question, sql, schema_text))
+                if record:
+                    repairs.append(correction["repairs"])
+                    statuses[correction["status"]] = statuses.get(correction["status"], 0) + 1
+                timed("execute", lambda: utils.execute_sql_query(correction["sql"]))
+            except Exception:
+                continue
+
+    if args.cache == "warm":
+        run_iteration(record=False)
+    for _ in range(args.iterations):
+        if args.cache == "cold":
+            reset_caches()
+        if args.tracemalloc:
+            tracemalloc.start()
+        run_iteration(record=True)
+        if args.tracemalloc:
+            heap_peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    stages = {stage: {**summarize(samples[stage]), "errors": errors[stage],
+                      "prompt_tokens_mean": sum(tokens[stage]) / len(tokens[stage]) if tokens[stage] else 0}
+              for stage in STAGES}
+    metrics = {}
+    for stage, stats in stages.items():
+        if stats["count"]:
+            metrics[f"{stage}.p50_seconds"] = stats["p50"]
+            metrics[f"{stage}.p95_seconds"] = stats["p95"]
+            metrics[f"{stage}.prompt_tokens_mean"] = stats["prompt_tokens_mean"]
+    metrics["correction.repairs_mean"] = sum(repairs) / len(repairs) if repairs else 0
+    metrics["memory.max_rss_bytes"] = max_rss_bytes()
+    if heap_peaks:
+        metrics["memory.heap_peak_bytes"] = max(heap_peaks)
+    results = {
+        "benchmark": "pipeline",
+        "config": {**vars(args), "workdir": workdir, "dataset_build_seconds": build_seconds},
+        "stages": stages,
+        "correction": {**summarize(repairs), "statuses": statuses},
+        "llm": {"calls": llm.calls, "prompt_tokens": llm.prompt_tokens},
+        "warehouse_queries": warehouse.queries,
+        "metrics": metrics,
+    }
+
+    print(f"{args.tables} tables x {args.columns} columns x {args.rows} rows, {len(questions)} questions x {args.iterations} iterations ({args.cache} caches)")
+    print_table([{"stage": stage, **stats} for stage, stats in stages.items()],
+                ["stage", "count", "p50", "p95", "max", "errors", "prompt_tokens_mean"])
+    print(f"\nrepairs per question: mean {metrics['correction.repairs_mean']:.2f}, statuses {statuses}")
+    print(f"LLM calls {llm.calls}, prompt tokens {llm.prompt_tokens:,}, warehouse queries {warehouse.queries:,}")
+    print(f"peak RSS {metrics['memory.max_rss_bytes'] / 2**20:.1f} MiB" +
+          (f", heap peak {metrics['memory.heap_peak_bytes'] / 2**20:.1f} MiB" if heap_peaks else ""))
+    if args.output:
+        write_results(args.output, results)
+        print(f"\nresults written to {args.output}")
+    if args.compare:
+        return report_regressions(results, args.compare, args.tolerance, args.min_delta)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Rerun benchmark for the analysis panels (src/panels.py) against a local SQLite warehouse and a fake LLM.
+
+A scripted session (analyze a quick question, preview its data, ask a deep-dive question, preview that)
+is replayed with Streamlit's AppTest, once with SQLGEN_UI_FRAGMENTS=false (every click reruns the whole
+script, as the app did before) and once with panel fragments and session-state memoization. AppTest always
+reruns the whole script, so both modes are charged with the full rerun (memoized in fragment mode); these
+are the headline figures. The ui.panel span of the panel that owns the widget (what a browser fragment
+rerun executes) is reported next to it as panel_p50, a per-panel proxy that is not comparable with a full
+rerun. LLM requests and warehouse statements are counted from the spans recorded during each rerun.
+
+    python -m benchmarks.reruns --tables 6 --rows 5000 --iterations 3 --output reruns.json
+    python -m benchmarks.reruns ... --compare reruns.json   # exit code 1 on regressions
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from benchmarks.common import print_table, report_regressions, summarize, write_results
+
+MODES = ["legacy", "fragments"]
+WAREHOUSE_SPANS = ("warehouse.query", "warehouse.fetch")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=6, help="tables in the generated schema")
+    parser.add_argument("--columns", type=int, default=10, help="columns per table")
+    parser.add_argument("--rows", type=int, default=5000, help="rows per table")
+    parser.add_argument("--iterations", type=int, default=3, help="replays of the scripted session per mode")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="directory for the dataset and caches (a temporary directory by default)")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run; exit 1 when a metric regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slack before a metric counts as regressed")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="absolute slack (seconds / counts)")
+    return parser.parse_args(argv)
+
+
+# The script AppTest runs: the analysis area for one selection, without the login and sidebar
+def analysis_app(catalog, schema, tables):
+    from src.panels import render_analysis
+    render_analysis("benchmark", catalog, schema, tables)
+
+
+def _widget(widgets, label):
+    return next(widget for widget in widgets if widget.label == label)
+
+
+# (interaction, panel owning the widget, action on the AppTest)
+def interactions(question: str) -> list:
+    return [
+        ("quick.analyze", "quick_analysis", lambda at: _widget(at.checkbox, "Analyze this question").check()),
+        ("quick.preview", "quick_analysis", lambda at: at.checkbox(key="d-1024").check()),
+        ("deep.question", "deep_analysis", lambda at: _widget(at.text_area, "Enter a deep-dive question here..").input(question)),
+        ("deep.generate", "deep_analysis", lambda at: at.checkbox(key="dd-10001").check()),
+        ("deep.preview", "deep_analysis", lambda at: at.checkbox(key="d-102").check()),
+        ("quick.preview_off", "quick_analysis", lambda at: at.checkbox(key="d-1024").uncheck()),
+    ]
+
+
+# Work recorded by one rerun: panels that ran, LLM requests (cache misses) and warehouse statements
+def _work(spans: list) -> dict:
+    return {
+        "panels": sum(record["name"] == "ui.panel" for record in spans),
+        "llm_requests": sum(record["name"] == "llm.stream" or (record["name"] == "llm.call" and not record["attributes"].get("cache_hit"))
+                            for record in spans),
+        "warehouse_statements": sum(record["name"] in WAREHOUSE_SPANS for record in spans),
+    }
+
+
+# One AppTest run, charged with the full rerun; in fragment mode panel_seconds is the run of the panel that owns the widget
+def _measure(at, mode: str, panel: str, telemetry) -> dict:
+    before = len(telemetry.recent_spans())
+    start = time.perf_counter()
+    at.run()
+    full_seconds = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"app raised during the benchmark: {at.exception[0].value}")
+    spans = telemetry.recent_spans()[before:]
+    if mode == "legacy":
+        return {"seconds": full_seconds, "panel_seconds": full_seconds, **_work(spans)}
+    owner = next(record for record in spans if record["name"] == "ui.panel" and record["attributes"].get("panel") == panel)
+    return {"seconds": full_seconds, "panel_seconds": owner["duration_ms"] / 1000, **_work(spans)}
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sqlgen-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    # the app reads its settings from the environment, so point it at the local stand-ins before importing it
+    os.environ["SQLGEN_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["SQLGEN_DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'session.db')}"
+    os.environ["SQLGEN_LLM_CACHE_BACKEND"] = "memory"
+    os.environ["SQLGEN_TELEMETRY_JSONL"] = "none"
+    os.environ["SQLGEN_TELEMETRY_RECENT_SPANS"] = "1000000"
+    os.environ["SQLGEN_SQL_DIALECT"] = "sqlite"
+    os.environ["SQLGEN_HISTORY_TABLE"] = "sqlgen_user_query_history"
+
+    import streamlit as st
+    from streamlit.logger import set_log_level
+    from streamlit.testing.v1 import AppTest
+    st.get_option("logger.level")
+    set_log_level("error")
+    from src import utils
+    from src.engine import engine_connection
+    from src.history import HISTORY_COLUMNS
+    from src.llm_cache import set_llm_cache
+    from src.result_cache import ResultCache, set_result_cache
+    from src.telemetry import get_telemetry
+    from benchmarks.fake_llm import FakeLLM, benchmark_questions
+    from benchmarks.warehouse import LocalWarehouse
+
+    warehouse = LocalWarehouse(os.path.join(workdir, "warehouse.db"))
+    spec = warehouse.build(args.tables, args.columns, args.rows, args.seed)
+    warehouse.attach()
+    # the Favourites tab reads the (empty) query history
+    with engine_connection() as conn:
+        conn.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS sqlgen_user_query_history ({', '.join(HISTORY_COLUMNS)})")
+        conn.commit()
+    utils.set_warehouse_query(warehouse.query)
+    llm = FakeLLM(spec, warehouse.schema, latency=args.llm_latency, seed=args.seed)
+    utils.set_chat_model_factory(llm.chat_model)
+    questions = benchmark_questions(spec, 4)
+    telemetry = get_telemetry()
+    steps = interactions(questions[-1])
+
+    samples = {mode: {"load": []} for mode in MODES}
+    for mode in MODES:
+        samples[mode].update({name: [] for name, _, _ in steps})
+    for _ in range(args.iterations):
+        for mode in MODES:
+            # every replay starts cold, as a new browser session on a freshly started app
+            st.cache_data.clear()
+            utils.clear_erd_diagram(warehouse.catalog, warehouse.schema, list(spec))
+            utils.get_schema_summary_cache().invalidate()
+            set_llm_cache(None)
+            set_result_cache(ResultCache())
+            os.environ["SQLGEN_UI_FRAGMENTS"] = "true" if mode == "fragments" else "false"
+            at = AppTest.from_function(analysis_app, args=(warehouse.catalog, warehouse.schema, list(spec)), default_timeout=120)
+            samples[mode]["load"].append(_measure(at, "legacy", None, telemetry))
+            for name, panel, action in steps:
+                action(at)
+                samples[mode][name].append(_measure(at, mode, panel, telemetry))
+    os.environ.pop("SQLGEN_UI_FRAGMENTS", None)
+
+    rows, metrics = [], {}
+    for mode in MODES:
+        for name, runs in samples[mode].items():
+            stats = summarize([run["seconds"] for run in runs])
+            work = {key: sum(run[key] for run in runs) / len(runs) for key in ("panels", "llm_requests", "warehouse_statements")}
+            rows.append({"mode": mode, "interaction": name, **stats, **work,
+                         "panel_p50": summarize([run["panel_seconds"] for run in runs])["p50"]})
+            metrics[f"{mode}.{name}.p50_seconds"] = stats["p50"]
+            metrics[f"{mode}.{name}.warehouse_statements"] = work["warehouse_statements"]
+        clicks = [run for name, runs in samples[mode].items() if name != "load" for run in runs]
+        metrics[f"{mode}.clicks.total_seconds"] = sum(run["seconds"] for run in clicks) / args.iterations
+        metrics[f"{mode}.clicks.panel_seconds"] = sum(run["panel_seconds"] for run in clicks) / args.iterations
+        metrics[f"{mode}.clicks.warehouse_statements"] = sum(run["warehouse_statements"] for run in clicks) / args.iterations
+        metrics[f"{mode}.clicks.llm_requests"] = sum(run["llm_requests"] for run in clicks) / args.iterations
+    results = {
+        "benchmark": "reruns",
+        "config": {**vars(args), "workdir": workdir},
+        "interactions": rows,
+        "metrics": metrics,
+    }
+
+    print(f"{args.tables} tables x {args.rows:,} rows, {len(steps)} clicks per session, {args.iterations} sessions per mode")
+    print_table(rows, ["mode", "interaction", "count", "p50", "p95", "panel_p50", "panels", "llm_requests", "warehouse_statements"])
+    for mode in MODES:
+        print(f"\n{mode}: {metrics[f'{mode}.clicks.total_seconds']:.3f}s (owning panels only: {metrics[f'{mode}.clicks.panel_seconds']:.3f}s), {metrics[f'{mode}.clicks.llm_requests']:.0f} LLM requests and "
+              f"{metrics[f'{mode}.clicks.warehouse_statements']:.0f} warehouse statements per session of clicks")
+    if args.output:
+        write_results(args.output, results)
+        print(f"\nresults written to {args.output}")
+    if args.compare:
+        return report_regressions(results, args.compare, args.tolerance, args.min_delta)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
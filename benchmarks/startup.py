@@ -0,0 +1,167 @@
+"""Cold-start and rerun benchmark for SQLGen.py.
+
+Import time is measured in fresh interpreters that run SQLGen.py's own import statements. It is measured
+twice: as the app imports today, and with the formerly eager dependencies (langchain, langchain_openai,
+SQLAlchemy, numpy) imported up front. The rerun part times the sidebar's catalog/schema/table lookups on a
+synthetic catalog: the previous per-rerun groupby over the metadata frame versus the cached catalog index.
+Streamlit's caches only hold values under `streamlit run`, so cache hits are reproduced here: st.cache_data
+unpickles its stored copy of the metadata frame on every hit, st.cache_resource hands back the shared index.
+
+    python -m benchmarks.startup --catalogs 4 --schemas 20 --tables 50 --output startup.json
+    python -m benchmarks.startup ... --compare startup.json   # exit code 1 on regressions
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.common import print_table, report_regressions, summarize, write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["langchain_core", "langchain_openai", "sqlalchemy", "pandas", "numpy"]
+EAGER_IMPORTS = ["langchain.prompts", "langchain.chains.llm", "langchain_openai", "langchain.output_parsers", "sqlalchemy", "numpy"]
+
+# Runs in a fresh interpreter: argv[1] is the path of SQLGen.py, argv[2] "eager" to import EAGER_IMPORTS first
+CHILD = """
+import ast, importlib, json, sys, time
+start = time.perf_counter()
+import streamlit as st
+from streamlit.logger import set_log_level
+st.get_option("logger.level")
+set_log_level("error")
+if sys.argv[2] == "eager":
+    for name in %(eager)r:
+        importlib.import_module(name)
+with open(sys.argv[1]) as f:
+    tree = ast.parse(f.read())
+imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+exec(compile(ast.Module(body=imports, type_ignores=[]), sys.argv[1], "exec"), {"__name__": "sqlgen_imports"})
+import_seconds = time.perf_counter() - start
+loaded = {name: name in sys.modules for name in %(heavy)r}
+start = time.perf_counter()
+for name in %(eager)r:
+    importlib.import_module(name)
+print(json.dumps({"import_seconds": import_seconds, "deferred_seconds": time.perf_counter() - start, "loaded": loaded}))
+""" % {"eager": EAGER_IMPORTS, "heavy": HEAVY_MODULES}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalogs", type=int, default=4, help="catalogs in the synthetic metadata")
+    parser.add_argument("--schemas", type=int, default=20, help="schemas per catalog (the same names in every catalog)")
+    parser.add_argument("--tables", type=int, default=50, help="tables per schema")
+    parser.add_argument("--import-iterations", type=int, default=5, help="fresh interpreters per import mode")
+    parser.add_argument("--reruns", type=int, default=200, help="simulated reruns per lookup strategy")
+    parser.add_argument("--workdir", help="directory for the app caches (a temporary directory by default)")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run; exit 1 when a metric regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slack before a metric counts as regressed")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="absolute slack (seconds)")
+    return parser.parse_args(argv)
+
+
+def measure_imports(mode: str, iterations: int, env: dict) -> list:
+    runs = []
+    for _ in range(iterations):
+        completed = subprocess.run([sys.executable, "-c", CHILD, os.path.join(ROOT, "SQLGen.py"), mode],
+                                   cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return runs
+
+
+def synthetic_metadata(catalogs: int, schemas: int, tables: int):
+    import pandas as pd
+    rows = [(f"catalog_{c}", f"schema_{s}", f"table_{c}_{s}_{t}") for c in range(catalogs) for s in range(schemas) for t in range(tables)]
+    return pd.DataFrame(rows, columns=["catalog", "schema", "tableName"])
+
+
+# The sidebar lookups as SQLGen.py did them before the catalog index, on every rerun
+def legacy_lookup(result_table, catalog: str, schema: str) -> list:
+    import numpy as np
+    import pandas as pd
+    df_databricks = pd.DataFrame(result_table)
+    df_databricks.columns = ["catalog", "schema", "table"]
+    catalog_schema_mapping_df = df_databricks.groupby(["catalog"]).agg({"schema": lambda x: list(np.unique(x))}).reset_index()
+    schema_table_mapping_df = df_databricks.groupby(["schema"]).agg({"table": lambda x: list(np.unique(x))}).reset_index()
+    df_databricks["catalog"].unique().tolist()
+    catalog_schema_mapping_df[catalog_schema_mapping_df["catalog"] == catalog]["schema"].values[0]
+    return schema_table_mapping_df[schema_table_mapping_df["schema"] == schema]["table"].values[0]
+
+
+def index_lookup(catalog_index: dict, catalog: str, schema: str) -> list:
+    list(catalog_index["index"])
+    list(catalog_index["index"].get(catalog, {}))
+    return list(catalog_index["index"].get(catalog, {}).get(schema, ()))
+
+
+def _timed_runs(count: int, fn) -> list:
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sqlgen-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.environ["SQLGEN_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["SQLGEN_TELEMETRY_JSONL"] = "none"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+
+    imports = {mode: measure_imports(mode, args.import_iterations, env) for mode in ("lazy", "eager")}
+
+    from src.crawler import build_catalog_index
+
+    metadata = synthetic_metadata(args.catalogs, args.schemas, args.tables)
+    cached_metadata = pickle.dumps(metadata)
+    catalog, schema = "catalog_0", "schema_0"
+    build = _timed_runs(max(args.reruns // 20, 3), lambda: build_catalog_index(metadata))
+    catalog_index = {"index": build_catalog_index(metadata), "crawl_failures": []}
+    legacy = _timed_runs(args.reruns, lambda: legacy_lookup(pickle.loads(cached_metadata), catalog, schema))
+    indexed = _timed_runs(args.reruns, lambda: index_lookup(catalog_index, catalog, schema))
+    legacy_tables = legacy_lookup(metadata, catalog, schema)
+    indexed_tables = index_lookup(catalog_index, catalog, schema)
+
+    stages = {
+        "import.lazy": summarize([run["import_seconds"] for run in imports["lazy"]]),
+        "import.eager": summarize([run["import_seconds"] for run in imports["eager"]]),
+        "import.deferred_first_llm": summarize([run["deferred_seconds"] for run in imports["lazy"]]),
+        "rerun.legacy_groupby": summarize(legacy),
+        "rerun.catalog_index": summarize(indexed),
+        "index.build": summarize(build),
+    }
+    metrics = {f"{name}.p50_seconds": stats["p50"] for name, stats in stages.items()}
+    metrics.update({f"{name}.p95_seconds": stats["p95"] for name, stats in stages.items()})
+    results = {
+        "benchmark": "startup",
+        "config": {**vars(args), "workdir": workdir, "metadata_rows": len(metadata)},
+        "stages": stages,
+        "heavy_modules_at_startup": imports["lazy"][0]["loaded"],
+        "schema_isolation": {"legacy_tables_offered": len(legacy_tables), "indexed_tables_offered": len(indexed_tables),
+                             "expected_tables": args.tables},
+        "metrics": metrics,
+    }
+
+    print(f"{args.catalogs} catalogs x {args.schemas} schemas x {args.tables} tables ({len(metadata):,} rows), "
+          f"{args.import_iterations} interpreters per import mode, {args.reruns} reruns")
+    print_table([{"stage": name, **stats} for name, stats in stages.items()], ["stage", "count", "p50", "p95", "max"])
+    loaded = results["heavy_modules_at_startup"]
+    print(f"\nloaded at startup: {', '.join(name for name, hit in loaded.items() if hit) or 'none'}; "
+          f"deferred: {', '.join(name for name, hit in loaded.items() if not hit) or 'none'}")
+    print(f"tables offered for {catalog}.{schema}: legacy {len(legacy_tables)}, index {len(indexed_tables)} (expected {args.tables})")
+    if args.output:
+        write_results(args.output, results)
+        print(f"\nresults written to {args.output}")
+    if args.compare:
+        return report_regressions(results, args.compare, args.tolerance, args.min_delta)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
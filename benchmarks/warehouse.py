@@ -0,0 +1,154 @@
+import json
+import os
+import random
+import re
+import sqlite3
+from datetime import date, timedelta
+import pandas as pd
+from sqlalchemy import event
+from src.engine import engine_connection, get_engine
+
+CATEGORY_VALUES = ["north", "south", "east", "west", "online"]
+COLUMN_KINDS = ["category", "amount", "label", "event_date"]
+COLUMN_TYPES = {"category": "string", "amount": "double", "label": "string", "event_date": "date"}
+
+
+class _CountDistinct:
+    def __init__(self):
+        self.values = set()
+
+    def step(self, value):
+        if value is not None:
+            self.values.add(value)
+
+    def finalize(self):
+        return len(self.values)
+
+
+class _CollectSet(_CountDistinct):
+    def finalize(self):
+        return json.dumps(sorted(self.values, key=str))
+
+
+def _slice(values, start, length):
+    return json.dumps(json.loads(values)[start - 1:start - 1 + length])
+
+
+# Deterministic star-ish dataset: entity_i has an id, a reference to entity_{i-1} and a mix of column kinds
+def dataset_spec(tables: int, columns: int) -> dict:
+    spec = {}
+    for i in range(tables):
+        cols = [("id", "bigint")]
+        if i > 0:
+            cols.append((f"entity_{i - 1}_id", "bigint"))
+        k = 0
+        while len(cols) < max(columns, 2):
+            kind = COLUMN_KINDS[k % len(COLUMN_KINDS)]
+            cols.append((f"{kind}_{k}", COLUMN_TYPES[kind]))
+            k += 1
+        spec[f"entity_{i}"] = cols
+    return spec
+
+
+class LocalWarehouse:
+    """SQLite stand-in for the Databricks warehouse.
+
+    Data lives in a SQLite file attached under the schema name, so two-part names (`sales.entity_0`) run
+    unchanged through the app's pooled engine. Databricks metadata statements (SHOW CATALOGS, DESCRIBE,
+    information_schema, ...) are answered from the dataset spec; everything else runs on SQLite.
+    """
+
+    def __init__(self, path: str, catalog: str = "bench", schema: str = "sales"):
+        self.path = path
+        self.catalog = catalog
+        self.schema = schema
+        self.spec = {}
+        self.queries = 0
+        self._catalog_prefix = re.compile(rf"`?{re.escape(catalog)}`?\.", re.IGNORECASE)
+
+    def build(self, tables: int, columns: int, rows: int, seed: int = 0) -> dict:
+        self.spec = dataset_spec(tables, columns)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        rng = random.Random(seed)
+        start = date(2024, 1, 1)
+        with sqlite3.connect(self.path) as conn:
+            for i, (table, cols) in enumerate(self.spec.items()):
+                conn.execute(f"CREATE TABLE {table} ({', '.join(f'{name} {col_type.upper()}' for name, col_type in cols)})")
+                values = []
+                for row_id in range(rows):
+                    row = []
+                    for name, _ in cols:
+                        if name == "id":
+                            row.append(row_id)
+                        elif name.endswith("_id"):
+                            row.append(rng.randrange(rows))
+                        elif name.startswith("category"):
+                            row.append(rng.choice(CATEGORY_VALUES))
+                        elif name.startswith("amount"):
+                            row.append(round(rng.uniform(1, 1000), 2))
+                        elif name.startswith("label"):
+                            row.append(f"label-{rng.randrange(rows * 10)}")
+                        else:
+                            row.append((start + timedelta(days=rng.randrange(365))).isoformat())
+                    values.append(row)
+                conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' for _ in cols)})", values)
+        return self.spec
+
+    # Attach the dataset and register Databricks functions the profiler uses on every pooled connection
+    def attach(self, engine=None) -> None:
+        engine = engine or get_engine()
+
+        def on_connect(dbapi_connection, _):
+            dbapi_connection.execute(f"ATTACH DATABASE '{self.path}' AS {self.schema}")
+            dbapi_connection.create_aggregate("approx_count_distinct", 1, _CountDistinct)
+            dbapi_connection.create_aggregate("collect_set", 1, _CollectSet)
+            dbapi_connection.create_function("slice", 3, _slice)
+
+        event.listen(engine, "connect", on_connect)
+        # connections opened before the listener existed would miss the attachment
+        engine.dispose()
+
+    def _ref(self, sql: str) -> str:
+        return sql.strip().rstrip(";").split()[-1].split(".")[-1].strip("`")
+
+    def _create_statement(self, table: str) -> str:
+        cols = ",\n".join(f"  {name} {col_type.upper()}" for name, col_type in self.spec[table])
+        return f"CREATE TABLE {self.catalog}.{self.schema}.{table} (\n{cols})\nUSING delta"
+
+    # read_sql replacement: Databricks metadata from the spec, everything else on SQLite
+    def query(self, sql: str) -> pd.DataFrame:
+        self.queries += 1
+        text = " ".join(sql.split())
+        upper = text.upper()
+        if upper == "SHOW CATALOGS":
+            return pd.DataFrame({"catalog": [self.catalog]})
+        if upper.startswith("SHOW SCHEMAS"):
+            return pd.DataFrame({"databaseName": [self.schema]})
+        if upper.startswith("SHOW TABLES"):
+            return pd.DataFrame({"database": self.schema, "tableName": list(self.spec), "isTemporary": False})
+        if upper.startswith("SHOW CREATE TABLE"):
+            return pd.DataFrame({"createtab_stmt": [self._create_statement(self._ref(text))]})
+        if upper.startswith("DESCRIBE DETAIL"):
+            return pd.DataFrame({"lastModified": [pd.Timestamp(os.path.getmtime(self.path), unit="s")]})
+        if upper.startswith("DESCRIBE"):
+            cols = self.spec[self._ref(text)]
+            return pd.DataFrame({"col_name": [c for c, _ in cols], "data_type": [t for _, t in cols], "comment": None})
+        if "INFORMATION_SCHEMA.TABLES" in upper:
+            if "LAST_ALTERED" in upper:
+                return pd.DataFrame({"table_name": list(self.spec), "last_altered": pd.Timestamp(os.path.getmtime(self.path), unit="s")})
+            return pd.DataFrame({"catalog": self.catalog, "schema": self.schema, "tableName": list(self.spec)})
+        if "INFORMATION_SCHEMA.COLUMNS" in upper:
+            rows = [(table, name, col_type) for table, cols in self.spec.items() for name, col_type in cols]
+            return pd.DataFrame(rows, columns=["table_name", "column_name", "full_data_type"])
+        if "INFORMATION_SCHEMA" in upper:
+            raise RuntimeError("information_schema view not available in the local warehouse")
+        if upper.startswith("EXPLAIN "):
+            text = "EXPLAIN QUERY PLAN " + text[len("EXPLAIN "):]
+        with engine_connection() as conn:
+            df = pd.read_sql(self._catalog_prefix.sub("", text), conn)
+        # collect_set results come back as JSON text from SQLite
+        for column in df.columns:
+            if re.fullmatch(r"c\d+_values", column):
+                df[column] = df[column].map(lambda value: json.loads(value) if isinstance(value, str) else value)
+        return df
@@ -0,0 +1,38 @@
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# Read typed settings from the environment (all SQLGen knobs use the SQLGEN_ prefix)
+def env_str(name: str, default=None):
+    value = os.getenv(name)
+    return default if value in (None, "") else value
+
+
+def env_int(name: str, default: int) -> int:
+    value = env_str(name)
+    return default if value is None else int(value)
+
+
+def env_float(name: str, default: float) -> float:
+    value = env_str(name)
+    return default if value is None else float(value)
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = env_str(name)
+    return default if value is None else value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_list(name: str, default=None) -> list:
+    value = env_str(name)
+    if value is None:
+        return list(default or [])
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+# Local directory for SQLGen's on-disk caches (shared by every session and process on the host)
+def cache_dir() -> str:
+    path = env_str("SQLGEN_CACHE_DIR", os.path.join(os.getcwd(), ".sqlgen_cache"))
+    os.makedirs(path, exist_ok=True)
+    return path
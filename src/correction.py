@@ -0,0 +1,138 @@
+import re
+import time
+from src.config import env_bool, env_float, env_int, env_str
+
+try:
+    import sqlglot
+    from sqlglot.errors import SqlglotError
+except ImportError:  # local parsing falls back to structural checks
+    sqlglot = None
+
+PLANNING_ERROR_MARKERS = ("Error occurred during query planning", "AnalysisException", "[PARSE_SYNTAX_ERROR]")
+
+
+# Correction loop settings: retry budget, wall-clock deadline and how far validation goes
+def correction_settings() -> dict:
+    return {
+        "max_repairs": env_int("SQLGEN_CORRECTION_MAX_REPAIRS", 3),
+        "deadline_seconds": env_float("SQLGEN_CORRECTION_DEADLINE", 90.0),
+        "probe": env_str("SQLGEN_VALIDATION_PROBE", "explain"),
+        "execute": env_bool("SQLGEN_VALIDATION_EXECUTE", False),
+        "dialect": env_str("SQLGEN_SQL_DIALECT", "databricks"),
+    }
+
+
+def strip_statement(sql: str) -> str:
+    return (sql or "").strip().rstrip(";").strip()
+
+
+def _strip_leading_comments(sql: str) -> str:
+    return re.sub(r"^(\s*(--[^\n]*\n?|/\*.*?\*/))*", "", sql, flags=re.DOTALL)
+
+
+def _balance_error(sql: str):
+    depth = 0
+    quote = None
+    for char in sql:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in ("'", '"', "`"):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth < 0:
+                return "Unbalanced parentheses"
+    if quote:
+        return f"Unterminated {quote} quote"
+    return "Unbalanced parentheses" if depth else None
+
+
+# Stage 1 - no network: sqlglot parse in the target dialect (or quote/parenthesis checks without sqlglot)
+def parse_locally(sql: str, dialect: str = "databricks"):
+    if not sql:
+        return "Empty SQL statement"
+    if not re.match(r"^\s*(\(\s*)*(SELECT|WITH|VALUES)\b", _strip_leading_comments(sql), re.IGNORECASE):
+        return "Only read-only SELECT / WITH queries can be generated"
+    if sqlglot is None:
+        return _balance_error(sql)
+    try:
+        statements = [s for s in sqlglot.parse(sql, read=dialect) if s is not None]
+    except SqlglotError as e:
+        # ParseError and TokenError (unterminated quote, truncated stream) go back to the repair prompt
+        return f"SQL parse error: {e}"
+    if len(statements) != 1:
+        return f"Expected a single statement, found {len(statements)}"
+    return None
+
+
+# Stage 2 - warehouse plans the query without running it (EXPLAIN, or a LIMIT 0 probe)
+def probe_on_warehouse(query_fn, sql: str, probe: str = "explain"):
+    try:
+        if probe == "limit0":
+            query_fn(f"SELECT * FROM ({sql}) AS sqlgen_probe LIMIT 0")
+            return None
+        plan = query_fn(f"EXPLAIN {sql}")
+        # Databricks reports analysis errors inside the EXPLAIN output instead of raising
+        plan_text = " ".join(str(value) for value in plan.to_numpy().ravel())
+        if any(marker in plan_text for marker in PLANNING_ERROR_MARKERS):
+            return plan_text.strip()
+        return None
+    except Exception as e:
+        return str(e)
+
+
+# Stage 3 - full execution, only when explicitly requested
+def execute_on_warehouse(query_fn, sql: str):
+    try:
+        query_fn(sql)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+# Run the stages in order, stopping at the first failure; returns (failed_stage, error, stage_timings)
+def validate_sql(query_fn, sql: str, probe: str = "explain", execute: bool = False, dialect: str = "databricks"):
+    stages = [("parse", lambda: parse_locally(sql, dialect)), ("probe", lambda: probe_on_warehouse(query_fn, sql, probe))]
+    if execute:
+        stages.append(("execute", lambda: execute_on_warehouse(query_fn, sql)))
+    timings = {}
+    for name, check in stages:
+        start = time.perf_counter()
+        error = check()
+        timings[name] = {"ok": error is None, "seconds": time.perf_counter() - start, "error": error}
+        if error:
+            return name, error, timings
+    return None, None, timings
+
+
+# Validate, repair with the LLM and re-validate until the SQL passes, the retry budget is spent or the deadline passes
+def correct_sql(question, sql, table_schema, query_fn, repair_fn, extract_fn=None, **overrides) -> dict:
+    settings = {**correction_settings(), **overrides}
+    start = time.monotonic()
+    deadline = start + settings["deadline_seconds"]
+    attempts = []
+    sql = strip_statement(sql)
+    status = "Exhausted"
+    for attempt in range(1, settings["max_repairs"] + 2):
+        failed_stage, error, stages = validate_sql(query_fn, sql, settings["probe"], settings["execute"], settings["dialect"])
+        attempts.append({"attempt": attempt, "sql": sql, "failed_stage": failed_stage, "error": error, "stages": stages})
+        if failed_stage is None:
+            status = "Correct"
+            break
+        # The last validation pass only checks the final repair; no repair follows it
+        if attempt > settings["max_repairs"]:
+            break
+        if time.monotonic() >= deadline:
+            status = "Timeout"
+            break
+        repaired = repair_fn(question, sql, table_schema, error)
+        sql = strip_statement(extract_fn(repaired) if extract_fn else repaired)
+    return {
+        "status": status,
+        "sql": sql,
+        "attempts": attempts,
+        "repairs": len(attempts) - 1,
+        "elapsed_seconds": time.monotonic() - start,
+    }
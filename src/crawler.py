@@ -0,0 +1,162 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fnmatch import fnmatch
+import pandas as pd
+from src.config import env_float, env_int, env_list, env_str
+
+METADATA_COLUMNS = ["catalog", "schema", "tableName"]
+
+
+# Crawler settings (SQLGEN_CRAWL_CATALOGS / SQLGEN_CRAWL_SCHEMAS accept comma separated glob patterns)
+def crawl_settings() -> dict:
+    return {
+        "mode": env_str("SQLGEN_CRAWL_MODE", "auto"),
+        "allowed_catalogs": env_list("SQLGEN_CRAWL_CATALOGS"),
+        "allowed_schemas": env_list("SQLGEN_CRAWL_SCHEMAS"),
+        "max_workers": env_int("SQLGEN_CRAWL_MAX_WORKERS", 8),
+        "catalog_timeout": env_float("SQLGEN_CRAWL_CATALOG_TIMEOUT", 60.0),
+    }
+
+
+# Empty pattern list means "allow everything"
+def _allowed(name: str, patterns: list) -> bool:
+    return not patterns or any(fnmatch(name, pattern) for pattern in patterns)
+
+
+# Schema patterns may be plain ("sales*") or catalog qualified ("main.sales*")
+def schema_allowed(catalog: str, schema: str, patterns: list) -> bool:
+    return not patterns or any(
+        fnmatch(f"{catalog}.{schema}", pattern) if "." in pattern else fnmatch(schema, pattern)
+        for pattern in patterns
+    )
+
+
+def _failure(stage: str, catalog: str, schema=None, error=None) -> dict:
+    return {"stage": stage, "catalog": catalog, "schema": schema, "error": str(error)}
+
+
+# Single round trip over Unity Catalog's information_schema for all visible catalogs
+def crawl_bulk(query_fn, catalogs: list) -> pd.DataFrame:
+    catalog_list = ", ".join("'" + catalog.replace("'", "''") + "'" for catalog in catalogs)
+    query = f"""
+    SELECT table_catalog AS catalog, table_schema AS `schema`, table_name AS tableName
+    FROM system.information_schema.tables
+    WHERE table_catalog IN ({catalog_list})
+    """
+    return query_fn(query)[METADATA_COLUMNS]
+
+
+# SHOW SCHEMAS / SHOW TABLES fanned out over a bounded thread pool with a deadline per catalog
+# A catalog's clock starts when its first statement starts, not while it waits for a pool thread
+def crawl_fanout(query_fn, catalogs: list, allowed_schemas: list, max_workers: int, catalog_timeout: float):
+    frames, failures = [], []
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sqlgen-crawl")
+    pending = {}
+    started = {}  # catalog -> time its first statement started (set on the worker thread)
+
+    def run(catalog, sql):
+        started.setdefault(catalog, time.monotonic())
+        return query_fn(sql)
+
+    def submit(catalog, sql):
+        return executor.submit(contextvars.copy_context().run, run, catalog, sql)
+
+    def deadline(catalog):
+        return started[catalog] + catalog_timeout if catalog in started else float("inf")
+
+    try:
+        for catalog in catalogs:
+            pending[submit(catalog, f"SHOW SCHEMAS IN `{catalog}`")] = (catalog, None)
+
+        while pending:
+            # catalogs still queued have no deadline yet; they start as running statements finish
+            next_deadline = min(deadline(catalog) for catalog, _ in pending.values())
+            timeout = None if next_deadline == float("inf") else max(0.0, next_deadline - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                catalog, schema = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failures.append(_failure("tables" if schema else "schemas", catalog, schema, e))
+                    continue
+                if schema is None:
+                    for name in result["databaseName"].tolist():
+                        if schema_allowed(catalog, name, allowed_schemas):
+                            pending[submit(catalog, f"SHOW TABLES IN `{catalog}`.`{name}`")] = (catalog, name)
+                else:
+                    tables = result[["tableName"]].copy()
+                    tables["catalog"] = catalog
+                    tables["schema"] = schema
+                    frames.append(tables[METADATA_COLUMNS])
+
+            now = time.monotonic()
+            expired = {catalog for catalog, _ in pending.values() if deadline(catalog) <= now}
+            for future, (catalog, schema) in list(pending.items()):
+                if catalog in expired:
+                    # only a statement that has not started is cancelled; a running one is left to finish
+                    future.cancel()
+                    del pending[future]
+                    failures.append(_failure("timeout", catalog, schema, f"catalog crawl exceeded {catalog_timeout}s"))
+    finally:
+        # drops queued statements only: statements already running on the warehouse finish in the background
+        # and their results are discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+    return frames, failures
+
+
+# Crawl catalogs -> schemas -> tables; returns (DataFrame[catalog, schema, tableName], failures)
+def crawl_table_metadata(query_fn, mode=None, allowed_catalogs=None, allowed_schemas=None, max_workers=None, catalog_timeout=None):
+    settings = crawl_settings()
+    mode = mode or settings["mode"]
+    allowed_catalogs = settings["allowed_catalogs"] if allowed_catalogs is None else allowed_catalogs
+    allowed_schemas = settings["allowed_schemas"] if allowed_schemas is None else allowed_schemas
+    max_workers = max_workers or settings["max_workers"]
+    catalog_timeout = catalog_timeout or settings["catalog_timeout"]
+
+    failures = []
+    catalogs = [c for c in query_fn("SHOW CATALOGS")["catalog"].tolist() if _allowed(c, allowed_catalogs)]
+    frames = []
+    remaining = catalogs
+    bulk_failure = None
+
+    if mode in ("auto", "bulk") and catalogs:
+        try:
+            bulk = crawl_bulk(query_fn, catalogs)
+            # hive_metastore and foreign catalogs are not listed in system.information_schema
+            listed = set(bulk["catalog"])
+            remaining = [c for c in catalogs if c not in listed]
+            keep = [schema_allowed(c, s, allowed_schemas) for c, s in zip(bulk["catalog"], bulk["schema"])]
+            bulk = bulk[pd.Series(keep, index=bulk.index, dtype=bool)]
+            frames.append(bulk)
+        except Exception as e:
+            bulk_failure = _failure("bulk", None, None, e)
+            if mode == "bulk":
+                failures.append(bulk_failure)
+                remaining = []
+
+    if mode in ("auto", "fanout") and remaining:
+        fanout_frames, fanout_failures = crawl_fanout(query_fn, remaining, allowed_schemas, max_workers, catalog_timeout)
+        frames.extend(fanout_frames)
+        # in auto mode a failed bulk query is only worth reporting when the fan-out did not fully recover from it
+        if bulk_failure is not None and fanout_failures:
+            failures.append(bulk_failure)
+        failures.extend(fanout_failures)
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=METADATA_COLUMNS), failures
+    tables = pd.concat(frames, ignore_index=True)[METADATA_COLUMNS]
+    tables = tables.sort_values(METADATA_COLUMNS).reset_index(drop=True)
+    return tables, failures
+
+
+# Nested {catalog: {schema: (tables...)}} view of crawled metadata; catalogs keep their crawl order,
+# schemas and tables are sorted and de-duplicated. Keyed by catalog first, so same-named schemas stay apart.
+def build_catalog_index(tables: pd.DataFrame) -> dict:
+    index = {}
+    for catalog, schema, table in tables[METADATA_COLUMNS].itertuples(index=False, name=None):
+        index.setdefault(catalog, {}).setdefault(schema, set()).add(table)
+    return {catalog: {schema: tuple(sorted(names)) for schema, names in sorted(schemas.items())}
+            for catalog, schemas in index.items()}
@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from src.config import env_bool, env_int, env_str
+from src.scheduler import register_cancel
+
+
+# Connection string for the Databricks SQL warehouse (SQLGEN_DATABASE_URL overrides it, e.g. sqlite:///local.db)
+def default_database_url() -> str:
+    override = env_str("SQLGEN_DATABASE_URL")
+    if override:
+        return override
+    return (
+        f"databricks://token:{os.getenv('DATABRICKS_ACCESS_TOKEN')}"
+        f"@{os.getenv('DATABRICKS_SERVER_HOSTNAME')}?http_path={os.getenv('DATABRICKS_HTTP_PATH')}"
+    )
+
+
+# Pool configuration, tunable per deployment through environment variables
+def pool_settings() -> dict:
+    return {
+        "pool_size": env_int("SQLGEN_POOL_SIZE", 5),
+        "max_overflow": env_int("SQLGEN_POOL_MAX_OVERFLOW", 10),
+        "pool_timeout": env_int("SQLGEN_POOL_TIMEOUT", 30),
+        "pool_recycle": env_int("SQLGEN_POOL_RECYCLE", 1800),
+        "pool_pre_ping": env_bool("SQLGEN_POOL_PRE_PING", True),
+    }
+
+
+# Hand the query scheduler a way to stop the statement about to run (cursor.cancel on Databricks, interrupt on SQLite)
+def _register_cursor_cancel(conn, cursor, *args) -> None:
+    register_cancel(getattr(cursor, "cancel", None) or getattr(conn.connection.dbapi_connection, "interrupt", None))
+
+
+class EngineRegistry:
+    """One shared SQLAlchemy engine per database URL for the whole process, with pool statistics.
+
+    SQLAlchemy is imported when the first engine is created, so app start-up does not pay for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._settings = {}
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _bump(self, url: str, key: str, amount=1) -> None:
+        with self._stats_lock:
+            if url in self._stats:
+                self._stats[url][key] += amount
+
+    def get(self, url: str = None, **overrides):
+        url = url or default_database_url()
+        engine = self._engines.get(url)
+        if engine is not None:
+            return engine
+        with self._lock:
+            if url not in self._engines:
+                settings = {**pool_settings(), **overrides}
+                self._settings[url] = settings
+                self._engines[url] = self._create(url, settings)
+            return self._engines[url]
+
+    def _create(self, url: str, settings: dict):
+        from sqlalchemy import create_engine, event, make_url
+        from sqlalchemy.pool import QueuePool
+        parsed = make_url(url)
+        pool_class = parsed.get_dialect().get_pool_class(parsed)
+        kwargs = {"pool_pre_ping": settings["pool_pre_ping"], "pool_recycle": settings["pool_recycle"]}
+        # SQLite in-memory/singleton pools do not accept sizing arguments
+        if issubclass(pool_class, QueuePool):
+            kwargs.update(
+                pool_size=settings["pool_size"],
+                max_overflow=settings["max_overflow"],
+                pool_timeout=settings["pool_timeout"],
+            )
+        engine = create_engine(url, **kwargs)
+        self._stats[url] = {"connects": 0, "checkouts": 0, "checkins": 0, "waits": 0, "wait_seconds": 0.0, "reconnects": 0}
+        event.listen(engine, "connect", lambda *args: self._bump(url, "connects"))
+        event.listen(engine, "checkout", lambda *args: self._bump(url, "checkouts"))
+        event.listen(engine, "checkin", lambda *args: self._bump(url, "checkins"))
+        # pre-ping failures and disconnect errors invalidate the DBAPI connection before a reconnect
+        event.listen(engine, "invalidate", lambda *args: self._bump(url, "reconnects"))
+        event.listen(engine, "before_cursor_execute", _register_cursor_cancel)
+        return engine
+
+    def _at_capacity(self, url: str, engine) -> bool:
+        from sqlalchemy.pool import QueuePool
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            return False
+        settings = self._settings[url]
+        return pool.checkedin() == 0 and pool.checkedout() >= settings["pool_size"] + settings["max_overflow"]
+
+    @contextmanager
+    def connect(self, url: str = None):
+        url = url or default_database_url()
+        engine = self.get(url)
+        waited = self._at_capacity(url, engine)
+        start = time.perf_counter()
+        with engine.connect() as conn:
+            if waited:
+                self._bump(url, "waits")
+                self._bump(url, "wait_seconds", time.perf_counter() - start)
+            yield conn
+
+    def health_check(self, url: str = None) -> dict:
+        from sqlalchemy import text
+        url = url or default_database_url()
+        start = time.perf_counter()
+        try:
+            with self.connect(url) as conn:
+                conn.execute(text("SELECT 1"))
+            return {"healthy": True, "latency_seconds": time.perf_counter() - start, "error": None}
+        except Exception as e:
+            # Drop pooled connections so the next checkout starts from a fresh handshake
+            if url in self._engines:
+                self._engines[url].dispose()
+            return {"healthy": False, "latency_seconds": time.perf_counter() - start, "error": str(e)}
+
+    def stats(self, url: str = None) -> dict:
+        url = url or default_database_url()
+        if url not in self._engines:
+            return {}
+        from sqlalchemy.pool import QueuePool
+        pool = self._engines[url].pool
+        with self._stats_lock:
+            snapshot = dict(self._stats[url])
+        snapshot["pool_class"] = type(pool).__name__
+        if isinstance(pool, QueuePool):
+            snapshot.update(
+                pool_size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        return snapshot
+
+    def dispose(self, url: str = None) -> None:
+        with self._lock:
+            urls = [url] if url else list(self._engines)
+            for key in urls:
+                engine = self._engines.pop(key, None)
+                if engine is not None:
+                    engine.dispose()
+                self._settings.pop(key, None)
+                self._stats.pop(key, None)
+
+
+_registry = EngineRegistry()
+
+
+# Shared engine for the process (created on first use)
+def get_engine(url: str = None):
+    return _registry.get(url)
+
+
+# Borrow a pooled connection, recording time spent waiting for a free slot
+def engine_connection(url: str = None):
+    return _registry.connect(url)
+
+
+# Run `SELECT 1` against the warehouse and report latency / error
+def engine_health(url: str = None) -> dict:
+    return _registry.health_check(url)
+
+
+# Checkouts, waits, reconnects and current pool occupancy
+def engine_stats(url: str = None) -> dict:
+    return _registry.stats(url)
+
+
+# Close every pooled connection (used on shutdown and in tests)
+def dispose_engines(url: str = None) -> None:
+    _registry.dispose(url)
@@ -0,0 +1,229 @@
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+from src.config import env_bool, env_int
+
+# Suffixes that mark a column as referencing another table's key (customer_id, customerid, customer_key, customer_sk)
+REFERENCE_SUFFIX_PATTERN = re.compile(r"^(?P<entity>[a-z0-9_]+?)_?(id|key|sk)$", re.IGNORECASE)
+# Warehouse naming prefixes/suffixes stripped when matching a column stem to a table name
+TABLE_AFFIXES = re.compile(r"^(dim|fact|fct|tbl|stg|raw|ref|lkp|d|f)_|_(dim|fact|tbl|table|v|vw|view)$", re.IGNORECASE)
+
+RELATIONSHIP_PROMPT = """
+You are reviewing inferred relationships for an Entity Relationship Diagram.
+Each line below is a foreign-key-like column followed by the tables it could reference (delimited by ##).
+
+##
+{candidates}
+##
+
+For each line pick the single most likely referenced table, or "none" when no candidate fits.
+Answer with one line per input line, formatted exactly as: table.column -> referenced_table
+"""
+
+
+# ERD settings: optional LLM pass for ambiguous relationships and the DESCRIBE fallback fan-out
+def erd_settings() -> dict:
+    return {
+        "llm_resolve": env_bool("SQLGEN_ERD_LLM_RESOLVE", False),
+        "max_workers": env_int("SQLGEN_ERD_MAX_WORKERS", 8),
+    }
+
+
+def _quote(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _in_list(values) -> str:
+    return ", ".join(_quote(value) for value in values)
+
+
+# Column names and types of every table; one information_schema query, DESCRIBE per table where that is unavailable
+def fetch_columns(query_fn, catalog: str, schema: str, tables: list, max_workers: int = 8) -> dict:
+    try:
+        df = query_fn(f"""
+        SELECT table_name, column_name, full_data_type
+        FROM `{catalog}`.information_schema.columns
+        WHERE table_schema = {_quote(schema)} AND table_name IN ({_in_list(tables)})
+        ORDER BY table_name, ordinal_position
+        """)
+        columns = {table: [] for table in tables}
+        for table, column, data_type in df.itertuples(index=False):
+            columns.setdefault(table, []).append((column, data_type))
+        if all(columns.values()):
+            return columns
+    except Exception:
+        # hive_metastore and other non-Unity catalogs have no information_schema
+        pass
+
+    def describe(table):
+        df = query_fn(f"DESCRIBE TABLE `{catalog}`.{schema}.{table}")
+        rows = []
+        for column, data_type in zip(df["col_name"], df["data_type"]):
+            # partition / metadata sections follow a blank or "#" row
+            if not column or str(column).startswith("#"):
+                break
+            rows.append((column, data_type))
+        return rows
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tables))), thread_name_prefix="sqlgen-erd") as executor:
+        # one context copy per task keeps the session user for the query scheduler
+        futures = [executor.submit(contextvars.copy_context().run, describe, table) for table in tables]
+        return dict(zip(tables, [future.result() for future in futures]))
+
+
+# Declared primary keys {table: [columns]} and foreign keys [(table, column, ref_table, ref_column)]
+def fetch_constraints(query_fn, catalog: str, schema: str, tables: list):
+    primary_keys, foreign_keys = {}, []
+    try:
+        df = query_fn(f"""
+        SELECT kcu.table_name, kcu.column_name, tc.constraint_type,
+               ref.table_name AS ref_table, ref.column_name AS ref_column
+        FROM `{catalog}`.information_schema.table_constraints tc
+        JOIN `{catalog}`.information_schema.key_column_usage kcu
+          ON kcu.constraint_schema = tc.constraint_schema AND kcu.constraint_name = tc.constraint_name
+        LEFT JOIN `{catalog}`.information_schema.referential_constraints rc
+          ON rc.constraint_schema = tc.constraint_schema AND rc.constraint_name = tc.constraint_name
+        LEFT JOIN `{catalog}`.information_schema.key_column_usage ref
+          ON ref.constraint_schema = rc.unique_constraint_schema AND ref.constraint_name = rc.unique_constraint_name
+         AND ref.ordinal_position = kcu.position_in_unique_constraint
+        WHERE tc.table_schema = {_quote(schema)} AND tc.table_name IN ({_in_list(tables)})
+          AND tc.constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY')
+        ORDER BY kcu.table_name, kcu.ordinal_position
+        """)
+    except Exception:
+        # no information_schema (or no constraints support): relationships come from column names only
+        return primary_keys, foreign_keys
+    for table, column, constraint_type, ref_table, ref_column in df.itertuples(index=False):
+        if constraint_type == "PRIMARY KEY":
+            primary_keys.setdefault(table, []).append(column)
+        elif ref_table:
+            foreign_keys.append((table, column, ref_table, ref_column))
+    return primary_keys, foreign_keys
+
+
+# "dim_customers" / "customer" / "Customer_Dim" -> "customer"
+def _entity_name(table: str) -> str:
+    name = TABLE_AFFIXES.sub("", table.lower())
+    for suffix, replacement in (("ies", "y"), ("ses", "s"), ("s", "")):
+        if name.endswith(suffix) and len(name) > len(suffix) + 2 and not name.endswith("ss"):
+            return name[: -len(suffix)] + replacement
+    return name
+
+
+# The column of `table` a reference would point to: declared PK, then `id`, then a column named like the reference
+def _key_column(table: str, columns: dict, primary_keys: dict, reference: str):
+    names = [name for name, _ in columns[table]]
+    if len(primary_keys.get(table, [])) == 1:
+        return primary_keys[table][0]
+    lowered = {name.lower(): name for name in names}
+    for candidate in ("id", reference.lower(), f"{_entity_name(table)}_id"):
+        if candidate in lowered:
+            return lowered[candidate]
+    return None
+
+
+# Relationships from declared constraints, then column-name heuristics; ties are kept and flagged as ambiguous
+def infer_relationships(columns: dict, primary_keys: dict = None, foreign_keys: list = None) -> list:
+    primary_keys = primary_keys or {}
+    relationships, declared = [], set()
+    for table, column, ref_table, ref_column in foreign_keys or []:
+        if table in columns and ref_table in columns:
+            relationships.append({"child": table, "column": column, "parent": ref_table, "parent_column": ref_column,
+                                  "source": "constraint", "ambiguous": False})
+            declared.add((table, column))
+    entities = {table: _entity_name(table) for table in columns}
+    for table in sorted(columns):
+        for column, _ in columns[table]:
+            if (table, column) in declared or column in primary_keys.get(table, []):
+                continue
+            match = REFERENCE_SUFFIX_PATTERN.match(column)
+            if not match or column.lower() in ("id", "key", "sk"):
+                continue
+            stem = _entity_name(match.group("entity"))
+            if stem == entities[table]:
+                # the table's own key (customers.customer_id)
+                continue
+            candidates = []
+            for parent in sorted(columns):
+                if parent == table:
+                    continue
+                entity = entities[parent]
+                # exact entity match ranks above a partial one (customer_id -> customer over customer_address)
+                rank = 0 if entity == stem else 1 if entity.endswith(f"_{stem}") or entity.startswith(f"{stem}_") else None
+                parent_column = _key_column(parent, columns, primary_keys, column) if rank is not None else None
+                if parent_column:
+                    candidates.append((rank, parent, parent_column))
+            if not candidates:
+                continue
+            best = min(rank for rank, _, _ in candidates)
+            top = [(parent, parent_column) for rank, parent, parent_column in candidates if rank == best]
+            for parent, parent_column in top:
+                relationships.append({"child": table, "column": column, "parent": parent, "parent_column": parent_column,
+                                      "source": "name", "ambiguous": len(top) > 1})
+    return relationships
+
+
+# Keep one candidate per ambiguous column, as chosen by the LLM (llm_fn(prompt_text) -> answer text)
+def resolve_ambiguous(relationships: list, llm_fn) -> list:
+    ambiguous = {}
+    for rel in relationships:
+        if rel["ambiguous"]:
+            ambiguous.setdefault(f"{rel['child']}.{rel['column']}", []).append(rel["parent"])
+    if not ambiguous:
+        return relationships
+    candidates = "\n".join(f"{column}: {', '.join(parents)}" for column, parents in sorted(ambiguous.items()))
+    try:
+        answer = llm_fn(RELATIONSHIP_PROMPT.format(candidates=candidates))
+    except Exception:
+        # the diagram is still useful with every candidate drawn as uncertain
+        return relationships
+    chosen = {}
+    for line in str(answer).splitlines():
+        if "->" in line:
+            column, parent = (part.strip().strip("`") for part in line.split("->", 1))
+            chosen[column] = parent
+    resolved = []
+    for rel in relationships:
+        key = f"{rel['child']}.{rel['column']}"
+        if not rel["ambiguous"] or key not in chosen:
+            resolved.append(rel)
+        elif chosen[key] == rel["parent"]:
+            resolved.append({**rel, "ambiguous": False, "source": "llm"})
+    return resolved
+
+
+# Mermaid identifiers and attribute types may only hold word characters
+def _mermaid_word(value: str) -> str:
+    return re.sub(r"_+", "_", re.sub(r"\W", "_", str(value))).strip("_") or "unknown"
+
+
+# Mermaid erDiagram code; declared relationships are solid lines, name-inferred ones dashed ("?" when ambiguous)
+def build_mermaid(columns: dict, primary_keys: dict = None, relationships: list = None) -> str:
+    primary_keys = primary_keys or {}
+    relationships = relationships or []
+    foreign = {(rel["child"], rel["column"]) for rel in relationships}
+    lines = ["erDiagram"]
+    for table in sorted(columns):
+        lines.append(f"    {_mermaid_word(table)} {{")
+        for column, data_type in columns[table]:
+            keys = [key for key, present in (("PK", column in primary_keys.get(table, [])), ("FK", (table, column) in foreign)) if present]
+            lines.append(f"        {_mermaid_word(data_type)} {_mermaid_word(column)}{' ' + ', '.join(keys) if keys else ''}")
+        lines.append("    }")
+    for rel in sorted(relationships, key=lambda rel: (rel["parent"], rel["child"], rel["column"])):
+        line = "--" if rel["source"] == "constraint" else ".."
+        label = f"{rel['column']}?" if rel["ambiguous"] else rel["column"]
+        lines.append(f"    {_mermaid_word(rel['parent'])} ||{line}o{{ {_mermaid_word(rel['child'])} : \"{label}\"")
+    return "\n".join(lines)
+
+
+# ERD for the selected tables built from warehouse metadata; llm_fn is only used for ambiguous relationships
+def generate_erd(query_fn, catalog: str, schema: str, tables: list, llm_fn=None, settings: dict = None) -> str:
+    settings = {**erd_settings(), **(settings or {})}
+    if not tables:
+        return "erDiagram"
+    columns = fetch_columns(query_fn, catalog, schema, list(tables), settings["max_workers"])
+    primary_keys, foreign_keys = fetch_constraints(query_fn, catalog, schema, list(tables))
+    relationships = infer_relationships(columns, primary_keys, foreign_keys)
+    if llm_fn is not None and settings["llm_resolve"]:
+        relationships = resolve_ambiguous(relationships, llm_fn)
+    return build_mermaid(columns, primary_keys, relationships)
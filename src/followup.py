@@ -0,0 +1,306 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import pandas as pd
+from src.config import env_bool, env_float, env_int, env_str
+from src.engine import engine_connection
+from src.result_cache import normalize_sql
+from src.results import fetch_result, limit_query
+from src.telemetry import increment, span
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # follow-ups keep running as inline MASTER CTEs
+    sqlglot = None
+
+try:
+    import duckdb
+except ImportError:  # local materializations use an in-memory SQLite database
+    duckdb = None
+
+MASTER_NAME = "master"
+TABLE_PREFIX = "sqlgen_master_"
+
+
+# Follow-up settings: materialize the MASTER result at all, how big a result is kept locally,
+# the warehouse schema for larger ones (unset = no warehouse materialization), idle TTL and per-session cap
+def followup_settings() -> dict:
+    return {
+        "enabled": env_bool("SQLGEN_FOLLOWUP_MATERIALIZE", True),
+        "local_max_bytes": env_int("SQLGEN_FOLLOWUP_LOCAL_MAX_BYTES", 64 * 1024 * 1024),
+        "scratch_schema": env_str("SQLGEN_FOLLOWUP_SCRATCH_SCHEMA"),
+        "ttl_seconds": env_float("SQLGEN_FOLLOWUP_TTL", 3600.0),
+        "max_materializations": env_int("SQLGEN_FOLLOWUP_MAX_PER_SESSION", 4),
+        "dialect": env_str("SQLGEN_SQL_DIALECT", "databricks"),
+    }
+
+
+# Run a statement that returns no rows (CREATE TABLE AS, DROP TABLE) and commit it
+def execute_statement(sql: str) -> None:
+    with engine_connection() as conn:
+        conn.exec_driver_sql(sql)
+        conn.commit()
+
+
+# Point a follow-up's MASTER CTE at a materialized table; returns (sql, only_master) or None when it cannot
+# only_master is False when the follow-up also reads warehouse tables (so it cannot run locally)
+def rewrite_followup(followup_sql: str, base_sql: str, table: str, dialect: str = "databricks", write: str = None):
+    if sqlglot is None:
+        return None
+    try:
+        tree = sqlglot.parse_one(followup_sql, read=dialect)
+    except Exception:
+        return None
+    ctes = list(tree.args["with"].expressions) if tree.args.get("with") else []
+    master = next((cte for cte in ctes if cte.alias_or_name.lower() == MASTER_NAME), None)
+    # the LLM is asked to copy the base query into MASTER; an edited copy means a different base result
+    if master is None or normalize_sql(master.this.sql(dialect=dialect), dialect) != normalize_sql(base_sql, dialect):
+        return None
+    master.pop()
+    if not tree.args["with"].expressions:
+        tree.set("with", None)
+    cte_names = {cte.alias_or_name.lower() for cte in ctes} - {MASTER_NAME}
+    only_master = True
+    for node in list(tree.find_all(exp.Table)):
+        if node.name.lower() == MASTER_NAME and not node.db:
+            replacement = exp.to_table(table)
+            replacement.set("alias", node.args.get("alias") or exp.TableAlias(this=exp.to_identifier("MASTER")))
+            node.replace(replacement)
+        elif node.name.lower() not in cte_names:
+            only_master = False
+    return tree.sql(dialect=write or dialect), only_master
+
+
+class Materialization:
+    """One materialized MASTER result: a local table (DuckDB / SQLite) or a table in the warehouse scratch schema."""
+
+    def __init__(self, key: str, location: str, table: str, rows: int, size: int):
+        self.key = key
+        self.location = location
+        self.table = table
+        self.rows = rows
+        self.bytes = size
+        self.created_at = time.time()
+        self.used_at = self.created_at
+
+    def describe(self) -> dict:
+        return {"location": self.location, "table": self.table, "rows": self.rows, "bytes": self.bytes}
+
+
+def _cleanup(state: dict, lock, execute_fn) -> None:
+    with lock:
+        materializations = list(state["items"].values())
+        state["items"].clear()
+        local, state["local"] = state["local"], None
+    for item in materializations:
+        if item.location == "warehouse":
+            try:
+                execute_fn(f"DROP TABLE IF EXISTS {item.table}")
+            except Exception:
+                # stale scratch tables are swept by TTL the next time a session materializes
+                pass
+    if local is not None:
+        local.close()
+
+
+# Drop scratch tables left behind by sessions that never ended cleanly (their names carry the creation time)
+def sweep_stale_materializations(query_fn, execute_fn, scratch_schema: str, ttl_seconds: float) -> int:
+    dropped = 0
+    try:
+        names = query_fn(f"SHOW TABLES IN {scratch_schema}")["tableName"].tolist()
+    except Exception:
+        return 0
+    for name in names:
+        match = re.fullmatch(rf"{TABLE_PREFIX}(\d+)_[0-9a-f]+", name)
+        if match and time.time() - int(match.group(1)) > ttl_seconds:
+            try:
+                execute_fn(f"DROP TABLE IF EXISTS {scratch_schema}.{name}")
+                dropped += 1
+            except Exception:
+                pass
+    return dropped
+
+
+class FollowupEngine:
+    """Per-session follow-up runner that computes each MASTER (base) result once and reuses it.
+
+    With SQLGEN_FOLLOWUP_SCRATCH_SCHEMA set, the base is written there with CREATE TABLE AS, so it is computed
+    once on the warehouse (pooled connections are separate warehouse sessions, so a session temp view would not
+    be visible to them). Without it, a base result that fits in local_max_bytes is fetched once into a local
+    table and follow-ups that only read MASTER run there; a base that does not fit is remembered as too big, so
+    later follow-ups and pages do not fetch it again. Anything else runs the generated SQL unchanged.
+    Materializations are dropped when the engine is garbage collected (its Streamlit session ended), on process
+    exit, or after ttl_seconds without use.
+    """
+
+    _swept = set()
+
+    def __init__(self, query_fn, fetch_fn=None, execute_fn=None, settings: dict = None):
+        self.settings = {**followup_settings(), **(settings or {})}
+        self.query_fn = query_fn
+        self.fetch_fn = fetch_fn or fetch_result  # fetch_fn(sql, limit=None, max_bytes=None, offset=0), as fetch_result
+        self.execute_fn = execute_fn or execute_statement
+        self._lock = threading.RLock()
+        self._state = {"items": OrderedDict(), "local": None}
+        self._finalizer = weakref.finalize(self, _cleanup, self._state, self._lock, self.execute_fn)
+        self._too_big = {}  # base key -> time a local fetch hit local_max_bytes
+        self._in_progress = {}  # base key -> Event set once its materialization finished (or failed)
+        self._counters = {"materialized_local": 0, "materialized_warehouse": 0, "reused": 0, "inline": 0, "too_big": 0, "errors": 0}
+
+    def _local(self):
+        if self._state["local"] is None:
+            self._state["local"] = duckdb.connect() if duckdb is not None else sqlite3.connect(":memory:", check_same_thread=False)
+        return self._state["local"]
+
+    def _local_dialect(self) -> str:
+        return "duckdb" if duckdb is not None else "sqlite"
+
+    def _drop(self, item: Materialization) -> None:
+        if item.location == "warehouse":
+            try:
+                self.execute_fn(f"DROP TABLE IF EXISTS {item.table}")
+            except Exception:
+                pass
+        elif self._state["local"] is not None:
+            if duckdb is not None:
+                self._state["local"].unregister(item.table)
+            else:
+                self._state["local"].execute(f"DROP TABLE IF EXISTS {item.table}")
+
+    def _expire(self) -> None:
+        items = self._state["items"]
+        now = time.time()
+        for key in [key for key, seen_at in self._too_big.items() if now - seen_at > self.settings["ttl_seconds"]]:
+            del self._too_big[key]
+        for key in [key for key, item in items.items() if now - item.used_at > self.settings["ttl_seconds"]]:
+            self._drop(items.pop(key))
+        while len(items) > max(self.settings["max_materializations"], 1):
+            self._drop(items.popitem(last=False)[1])
+
+    def _store_local(self, key: str, df) -> Materialization:
+        table = f"{TABLE_PREFIX}{key}"
+        if duckdb is not None:
+            self._local().register(table, df)
+        else:
+            df.to_sql(table, self._local(), index=False, if_exists="replace")
+        return Materialization(key, "local", table, len(df), int(df.attrs.get("bytes") or 0))
+
+    def _store_warehouse(self, key: str, base_sql: str) -> Materialization:
+        scratch = self.settings["scratch_schema"]
+        if scratch not in FollowupEngine._swept:
+            FollowupEngine._swept.add(scratch)
+            sweep_stale_materializations(self.query_fn, self.execute_fn, scratch, self.settings["ttl_seconds"])
+        table = f"{scratch}.{TABLE_PREFIX}{int(time.time())}_{key}"
+        self.execute_fn(f"CREATE TABLE {table} AS {base_sql}")
+        rows = int(self.query_fn(f"SELECT COUNT(*) AS row_count FROM {table}").iloc[0, 0])
+        return Materialization(key, "warehouse", table, rows, 0)
+
+    # Materialize the base result (once per session); None when it fits nowhere
+    # The session lock is only held to look up and record entries: the fetch or CREATE TABLE AS runs outside it,
+    # and other callers for the same base wait on its in-progress marker instead of materializing it again
+    def materialize(self, base_sql: str):
+        key = hashlib.sha256(normalize_sql(base_sql, self.settings["dialect"]).encode()).hexdigest()[:16]
+        with self._lock:
+            self._expire()
+            item = self._state["items"].get(key)
+            if item is not None:
+                item.used_at = time.time()
+                self._state["items"].move_to_end(key)
+                self._counters["reused"] += 1
+                return item
+            if key in self._too_big:
+                self._counters["too_big"] += 1
+                return None
+            done = self._in_progress.get(key)
+            if done is None:
+                self._in_progress[key] = threading.Event()
+        if done is not None:
+            done.wait()
+            # finished (reused / too big) or failed (this caller tries again)
+            return self.materialize(base_sql)
+        try:
+            with span("followup.materialize") as current:
+                item, df = None, None
+                if self.settings["scratch_schema"]:
+                    item = self._store_warehouse(key, base_sql)
+                else:
+                    df = self.fetch_fn(base_sql, max_bytes=self.settings["local_max_bytes"])
+                with self._lock:
+                    if df is not None and not df.attrs.get("truncated"):
+                        item = self._store_local(key, df)
+                    if item is None:
+                        self._too_big[key] = time.time()
+                    else:
+                        self._counters[f"materialized_{item.location}"] += 1
+                        self._state["items"][key] = item
+                        self._expire()
+                current.set(location=item.location if item else None, rows=item.rows if item else None)
+            return item
+        finally:
+            with self._lock:
+                self._in_progress.pop(key).set()
+
+    def _run_local(self, sql: str, limit: int = None, offset: int = 0):
+        if limit:
+            # one extra row tells whether another page exists
+            sql = limit_query(sql, limit + 1, self._local_dialect(), offset)
+        with self._lock:
+            if duckdb is not None:
+                df = self._local().execute(sql).df()
+            else:
+                df = pd.read_sql_query(sql, self._local())
+        has_more = bool(limit) and len(df) > limit
+        if has_more:
+            df = df.iloc[:limit].reset_index(drop=True)
+        size = int(df.memory_usage(deep=True).sum())
+        df.attrs.update(has_more=has_more, truncated=False, bytes=size)
+        return df
+
+    # Run a follow-up over the materialized base result; attrs["followup"] reports where it ran
+    # limit / offset select the page returned (attrs has_more / truncated / bytes as in fetch_result)
+    def run(self, base_sql: str, followup_sql: str, limit: int = None, offset: int = 0):
+        item = None
+        if self.settings["enabled"]:
+            try:
+                item = self.materialize(base_sql)
+            except Exception:
+                # e.g. no CREATE privilege on the scratch schema: the generated SQL still runs as written
+                self._counters["errors"] += 1
+        mode, sql = "inline", followup_sql
+        if item is not None:
+            write = self._local_dialect() if item.location == "local" else None
+            rewritten = rewrite_followup(followup_sql, base_sql, item.table, self.settings["dialect"], write)
+            if rewritten is not None and (item.location == "warehouse" or rewritten[1]):
+                mode, sql = item.location, rewritten[0]
+        with span("followup.query", mode=mode) as current:
+            df = None
+            if mode == "local":
+                try:
+                    df = self._run_local(sql, limit, offset)
+                except Exception:
+                    # the local engine lacks a warehouse function (DATE_TRUNC units, percentile_approx on SQLite, ...)
+                    self._counters["errors"] += 1
+                    mode, sql = "inline", followup_sql
+                    current.set(mode=mode, local_fallback=True)
+            if df is None:
+                df = self.fetch_fn(sql, limit=limit, offset=offset)
+            current.set(rows=len(df))
+        increment("sqlgen_followup_queries_total", mode=mode)
+        self._counters["inline"] += mode == "inline"
+        df.attrs["followup"] = {"mode": mode, **(item.describe() if item and mode != "inline" else {})}
+        return df
+
+    def stats(self) -> dict:
+        with self._lock:
+            items = list(self._state["items"].values())
+            return {**self._counters, "materializations": len(items),
+                    "local_bytes": sum(item.bytes for item in items if item.location == "local")}
+
+    # Drop every materialization now (also runs automatically when the engine is garbage collected)
+    def close(self) -> None:
+        self._finalizer()
@@ -0,0 +1,481 @@
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import warnings
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+from src.config import cache_dir, env_bool, env_float, env_int, env_str
+from src.engine import engine_connection
+from src.scheduler import get_scheduler
+from src.telemetry import get_telemetry
+
+try:
+    import fcntl
+except ImportError:  # Windows: journal owners are recognised by the PID in the file name only
+    fcntl = None
+
+HISTORY_COLUMNS = ["user_name", "timestamp", "question", "query", "favourite", "catalog_name", "schema_name"]
+# Columns of the original table; catalog_name / schema_name are only written once the table has them
+LEGACY_HISTORY_COLUMNS = HISTORY_COLUMNS[:5]
+SCOPE_COLUMNS = HISTORY_COLUMNS[5:]
+
+
+# Write-behind settings for the query history table
+def history_settings() -> dict:
+    return {
+        "table": env_str("SQLGEN_HISTORY_TABLE", "hive_metastore.dev_tools.sqlgen_user_query_history"),
+        "batch_size": env_int("SQLGEN_HISTORY_BATCH_SIZE", 50),
+        "flush_interval": env_float("SQLGEN_HISTORY_FLUSH_INTERVAL", 5.0),
+        "max_queue": env_int("SQLGEN_HISTORY_MAX_QUEUE", 1000),
+        "enqueue_timeout": env_float("SQLGEN_HISTORY_ENQUEUE_TIMEOUT", 10.0),
+        "journal": env_bool("SQLGEN_HISTORY_JOURNAL", True),
+        "scope_columns": env_bool("SQLGEN_HISTORY_SCOPE_COLUMNS", True),
+        "days": env_int("SQLGEN_HISTORY_DAYS", 20),
+        "refresh_seconds": env_float("SQLGEN_HISTORY_REFRESH_SECONDS", 300.0),
+        "refresh_overlap": env_float("SQLGEN_HISTORY_REFRESH_OVERLAP", 600.0),
+        "warehouse_timezone": env_str("SQLGEN_HISTORY_TIMEZONE", "UTC"),
+    }
+
+
+# Naive-UTC ISO timestamp with microseconds, so warehouse and local rows compare and dedupe as strings
+# Naive values are read in naive_tz: rows written with current_timestamp() come back in the warehouse session timezone
+def timestamp_key(value, naive_tz: str = "UTC") -> str:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize(naive_tz)
+    ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts.to_pydatetime().isoformat(timespec="microseconds")
+
+
+# One parameterized multi-row INSERT for a batch of events
+def build_insert(table: str, events: list, columns: list = None):
+    columns = columns or HISTORY_COLUMNS
+    rows, params = [], {}
+    for i, event in enumerate(events):
+        rows.append("(" + ", ".join(f":{column}_{i}" for column in columns) + ")")
+        for column in columns:
+            value = event.get(column)
+            params[f"{column}_{i}"] = datetime.fromisoformat(value) if column == "timestamp" else value
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(rows)}"
+    return sql, params
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Open `path` holding an exclusive flock on it; None while another writer (in any process) holds the lock
+def _try_lock(path: str):
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+# History statements go through the query scheduler like every other warehouse statement
+def _execute_insert(sql: str, params: dict) -> None:
+    from sqlalchemy import text
+
+    def run():
+        with engine_connection() as conn:
+            conn.execute(text(sql), params)
+            conn.commit()
+
+    get_scheduler().run(run, kind="query")
+
+
+# Columns to write: the scope columns are only written when the table already has them
+# The shared history table is never altered from the app; a missing column is reported once (see the README for the DDL)
+def prepare_history_table(table: str, scope_columns: bool = True) -> list:
+    if not scope_columns:
+        return LEGACY_HISTORY_COLUMNS
+
+    def run():
+        with engine_connection() as conn:
+            return {column.lower() for column in conn.exec_driver_sql(f"SELECT * FROM {table} LIMIT 0").keys()}
+
+    existing = get_scheduler().run(run, kind="metadata")
+    missing = [column for column in SCOPE_COLUMNS if column not in existing]
+    if missing:
+        # reads fall back to matching the schema inside the query text
+        warnings.warn(f"{table} has no {', '.join(missing)} column(s); history rows are written without them. "
+                      f"Add them with ALTER TABLE {table} ADD COLUMNS (catalog_name STRING, schema_name STRING)")
+    return LEGACY_HISTORY_COLUMNS + [column for column in SCOPE_COLUMNS if column in existing]
+
+
+# History rows of one user written after `since` (bound parameters, no LIKE scan)
+# since should be timezone-aware so the warehouse compares it as an instant, whatever its session timezone
+def fetch_history_since(table: str, user_name: str, since: datetime) -> pd.DataFrame:
+    from sqlalchemy import text
+    query = text(f"SELECT * FROM {table} WHERE user_name = :user_name AND timestamp > :since ORDER BY timestamp")
+
+    def run():
+        with engine_connection() as conn:
+            return pd.read_sql(query, conn, params={"user_name": user_name, "since": since})
+
+    df = get_scheduler().run(run, kind="query", key=f"history:{table}:{user_name}:{since.isoformat()}")
+    df.columns = [column.lower() for column in df.columns]
+    return df.reindex(columns=HISTORY_COLUMNS)
+
+
+class HistoryWriter:
+    """Buffers history events in-process (and in a local journal) and flushes them in batches from a background thread."""
+
+    def __init__(self, settings: dict = None, execute_fn=None, journal_dir: str = None, prepare_fn=None):
+        self.settings = {**history_settings(), **(settings or {})}
+        self.execute_fn = execute_fn or _execute_insert
+        self.prepare_fn = prepare_fn or prepare_history_table
+        self._columns = None
+        self.journal_dir = journal_dir or cache_dir()
+        # one journal per process so concurrent app workers never rewrite each other's events
+        self.journal_path = os.path.join(self.journal_dir, f"history_journal-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl") if self.settings["journal"] else None
+        # held for the writer's lifetime: other writers see the journal as owned while this lock is taken
+        self._journal_lock = _try_lock(f"{self.journal_path}.lock") if self.journal_path and fcntl is not None else None
+        self._queue = deque()
+        self._lock = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._metrics = {
+            "enqueued": 0, "flushed": 0, "batches": 0, "failed_flushes": 0, "backpressure_waits": 0,
+            "last_flush_seconds": 0.0, "max_flush_seconds": 0.0, "total_flush_seconds": 0.0,
+        }
+        self._replay_journal()
+        self._thread = threading.Thread(target=self._run, name="sqlgen-history-writer", daemon=True)
+        self._thread.start()
+
+    # Whether the writer of another journal is gone; returns (gone, lock to release once the journal is replayed)
+    # Its flock tells, not the PID in the name: containers reuse PIDs (often PID 1) across restarts
+    def _journal_owner_gone(self, path: str):
+        lock_path = f"{path}.lock"
+        if fcntl is not None and os.path.exists(lock_path):
+            lock = _try_lock(lock_path)
+            return lock is not None, lock
+        pid = int(os.path.basename(path).split("-")[1])
+        if fcntl is not None and pid == os.getpid():
+            # every writer of this process holds a lock file, so this journal is from an earlier process
+            return True, None
+        return not _process_alive(pid), None
+
+    # Events journaled by writers that are no longer running are queued again
+    def _replay_journal(self) -> None:
+        if not self.journal_path:
+            return
+        for path in glob.glob(os.path.join(self.journal_dir, "history_journal-*.jsonl")):
+            if path == self.journal_path:
+                continue
+            gone, lock = self._journal_owner_gone(path)
+            if not gone:
+                continue
+            claimed = f"{path}.replaying-{os.getpid()}"
+            try:
+                # atomic claim: when two new processes race for a journal only one wins the rename
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                claimed = None
+            if claimed is not None:
+                with open(claimed) as f:
+                    self._queue.extend(json.loads(line) for line in f if line.strip())
+                os.remove(claimed)
+            if lock is not None:
+                os.remove(lock.name)
+                lock.close()
+        if self._queue:
+            self._rewrite_journal()
+
+    def _rewrite_journal(self) -> None:
+        if not self.journal_path:
+            return
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, "w") as f:
+            for event in self._queue:
+                f.write(json.dumps(event) + "\n")
+        os.replace(tmp_path, self.journal_path)
+
+    # Queue an event; blocks (backpressure) while the queue is full
+    # The timestamp is the app server's clock as a UTC instant (ISO with offset); it is bound as a timezone-aware
+    # parameter, so the warehouse stores the same instant current_timestamp() would have, in any session timezone
+    def log(self, user_name, question, query, is_favorite, catalog=None, schema=None) -> dict:
+        event = {
+            "id": uuid.uuid4().hex,
+            "user_name": user_name,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="microseconds"),
+            "question": question,
+            "query": query,
+            "favourite": bool(is_favorite),
+            "catalog_name": catalog,
+            "schema_name": schema,
+        }
+        with self._lock:
+            if len(self._queue) >= self.settings["max_queue"]:
+                self._metrics["backpressure_waits"] += 1
+                self._lock.notify_all()
+                if not self._lock.wait_for(lambda: len(self._queue) < self.settings["max_queue"], timeout=self.settings["enqueue_timeout"]):
+                    raise TimeoutError("History queue is full; the warehouse is not accepting writes")
+            self._queue.append(event)
+            self._metrics["enqueued"] += 1
+            if self.journal_path:
+                with open(self.journal_path, "a") as f:
+                    f.write(json.dumps(event) + "\n")
+            if len(self._queue) >= self.settings["batch_size"]:
+                self._lock.notify_all()
+        return event
+
+    # Events not yet written to the warehouse
+    def pending(self, user_name: str = None) -> list:
+        with self._lock:
+            return [dict(event) for event in self._queue if user_name is None or event["user_name"] == user_name]
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._queue)[: self.settings["batch_size"]]
+            if not batch:
+                return 0
+            start = time.perf_counter()
+            try:
+                if self._columns is None:
+                    self._columns = self.prepare_fn(self.settings["table"], self.settings["scope_columns"])
+                sql, params = build_insert(self.settings["table"], batch, self._columns)
+                self.execute_fn(sql, params)
+            except Exception:
+                with self._lock:
+                    self._metrics["failed_flushes"] += 1
+                raise
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                flushed_ids = {event["id"] for event in batch}
+                self._queue = deque(event for event in self._queue if event["id"] not in flushed_ids)
+                self._rewrite_journal()
+                self._metrics["flushed"] += len(batch)
+                self._metrics["batches"] += 1
+                self._metrics["last_flush_seconds"] = elapsed
+                self._metrics["max_flush_seconds"] = max(self._metrics["max_flush_seconds"], elapsed)
+                self._metrics["total_flush_seconds"] += elapsed
+                self._lock.notify_all()
+            return len(batch)
+
+    # Flush everything queued, batch by batch
+    def flush_all(self) -> int:
+        total = 0
+        while True:
+            flushed = self.flush()
+            if not flushed:
+                return total
+            total += flushed
+
+    def _run(self) -> None:
+        backoff = self.settings["flush_interval"]
+        while True:
+            failing = backoff > self.settings["flush_interval"]
+            with self._lock:
+                # a full batch only triggers an early flush while the warehouse is healthy
+                self._lock.wait_for(
+                    lambda: self._closed or (not failing and len(self._queue) >= self.settings["batch_size"]),
+                    timeout=backoff,
+                )
+                if self._closed:
+                    return
+            try:
+                self.flush_all()
+                backoff = self.settings["flush_interval"]
+            except Exception:
+                # keep the events and retry later, backing off while the warehouse is unavailable
+                backoff = min(backoff * 2, 300.0)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        self._thread.join(timeout=5)
+        try:
+            self.flush_all()
+        except Exception:
+            # undelivered events stay in the journal and are replayed on the next start
+            pass
+        if self.journal_path and not self._queue:
+            # nothing left to deliver: no journal for the next start to inspect
+            for path in (self.journal_path, f"{self.journal_path}.lock"):
+                if os.path.exists(path):
+                    os.remove(path)
+        if self._journal_lock is not None:
+            self._journal_lock.close()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["queue_depth"] = len(self._queue)
+        metrics["avg_flush_seconds"] = metrics["total_flush_seconds"] / metrics["batches"] if metrics["batches"] else 0.0
+        return metrics
+
+
+class HistoryStore:
+    """Local per-user read-through copy of the history table, refreshed incrementally from a watermark."""
+
+    def __init__(self, path: str = None, settings: dict = None, fetch_fn=None):
+        self.settings = {**history_settings(), **(settings or {})}
+        self.path = path or os.path.join(cache_dir(), "history_store.sqlite")
+        self.fetch_fn = fetch_fn or (lambda user_name, since: fetch_history_since(self.settings["table"], user_name, since))
+        self._versions = {}  # user -> bumped whenever that user's rows change
+        self._synced_at = {}  # user -> last warehouse refresh (epoch seconds)
+        self._frames = {}  # (user, catalog, schema, cutoff) -> (version, DataFrame)
+        self._counters = {"hits": 0, "misses": 0, "refreshes": 0, "rows_fetched": 0}
+        self._lock = threading.RLock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS history_rows (
+                    user_name TEXT, timestamp TEXT, question TEXT, query TEXT, favourite INTEGER,
+                    catalog_name TEXT, schema_name TEXT,
+                    UNIQUE (user_name, timestamp, question)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS history_rows_scope ON history_rows (user_name, catalog_name, schema_name, timestamp)")
+            conn.execute("CREATE TABLE IF NOT EXISTS history_sync (user_name TEXT PRIMARY KEY, watermark TEXT, synced_at REAL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _bump(self, user_name: str) -> None:
+        self._versions[user_name] = self._versions.get(user_name, 0) + 1
+
+    # Store rows (events or warehouse rows); duplicates of rows already held are ignored
+    # Timestamps are kept as naive-UTC keys; naive warehouse values are converted from warehouse_timezone first
+    def add(self, rows: list) -> int:
+        values = [
+            (row["user_name"], timestamp_key(row["timestamp"], self.settings["warehouse_timezone"]), row["question"], row["query"], int(bool(row["favourite"])),
+             row.get("catalog_name"), row.get("schema_name"))
+            for row in rows
+        ]
+        with self._lock, self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO history_rows VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+            added = conn.total_changes - before
+            for user_name in {row[0] for row in values}:
+                self._bump(user_name)
+        return added
+
+    def _sync_state(self, conn, user_name: str):
+        row = conn.execute("SELECT watermark, synced_at FROM history_sync WHERE user_name=?", (user_name,)).fetchone()
+        return row if row else (None, None)
+
+    # True when the user's rows were never fetched here or the last refresh is older than refresh_seconds
+    def needs_refresh(self, user_name: str) -> bool:
+        with self._lock:
+            synced_at = self._synced_at.get(user_name)
+            if synced_at is None:
+                with self._connect() as conn:
+                    synced_at = self._sync_state(conn, user_name)[1] or 0.0
+                self._synced_at[user_name] = synced_at
+        return time.time() - synced_at > self.settings["refresh_seconds"]
+
+    # Fetch only rows newer than the last one seen (minus an overlap for writes still in other writers' queues)
+    def refresh(self, user_name: str) -> int:
+        with self._connect() as conn:
+            watermark = self._sync_state(conn, user_name)[0]
+        if watermark is None:
+            since = datetime.now(timezone.utc) - timedelta(days=self.settings["days"])
+        else:
+            since = datetime.fromisoformat(watermark).replace(tzinfo=timezone.utc) - timedelta(seconds=self.settings["refresh_overlap"])
+        df = self.fetch_fn(user_name, since)
+        rows = df.to_dict("records")
+        added = self.add(rows) if rows else 0
+        if rows:
+            latest = max(timestamp_key(row["timestamp"], self.settings["warehouse_timezone"]) for row in rows)
+            watermark = max(watermark, latest) if watermark else latest
+        synced_at = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO history_sync VALUES (?, ?, ?)", (user_name, watermark, synced_at))
+            self._synced_at[user_name] = synced_at
+            self._counters["refreshes"] += 1
+            self._counters["rows_fetched"] += len(rows)
+        return added
+
+    # Force a refresh of one user's rows on their next read (other users keep their cached rows)
+    def invalidate(self, user_name: str) -> None:
+        with self._lock:
+            self._synced_at[user_name] = 0.0
+            self._bump(user_name)
+
+    # A user's history for one catalog/schema, newest first; memoized until that user's rows change
+    def rows(self, user_name: str, catalog: str = None, schema: str = None) -> pd.DataFrame:
+        cutoff = timestamp_key(datetime.now(timezone.utc).date() - timedelta(days=self.settings["days"]))
+        key = (user_name, catalog, schema, cutoff)
+        with self._lock:
+            version = self._versions.get(user_name, 0)
+            cached = self._frames.get(key)
+            if cached and cached[0] == version:
+                self._counters["hits"] += 1
+                return cached[1].copy(deep=False)
+            self._counters["misses"] += 1
+        query = f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history_rows WHERE user_name = ? AND timestamp > ?"
+        params = [user_name, cutoff]
+        if schema is not None:
+            # rows written before the scope columns existed only carry the schema inside the query text
+            query += " AND (schema_name = ? OR (schema_name IS NULL AND instr(query, ?) > 0))"
+            params += [schema, schema]
+        if catalog is not None:
+            query += " AND (catalog_name = ? OR catalog_name IS NULL)"
+            params.append(catalog)
+        with self._connect() as conn:
+            df = pd.read_sql_query(query + " ORDER BY timestamp DESC", conn, params=params)
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        df["favourite"] = df["favourite"].astype(bool)
+        with self._lock:
+            self._frames = {k: v for k, v in self._frames.items() if k[0] != user_name or v[0] == version}
+            self._frames[key] = (version, df)
+        return df.copy(deep=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "cached_frames": len(self._frames)}
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_store = None
+
+
+# Process-wide writer, flushed on interpreter shutdown
+def get_history_writer() -> HistoryWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = HistoryWriter()
+                atexit.register(_writer.close)
+                get_telemetry().register_gauges("history", _writer.metrics)
+    return _writer
+
+
+# Process-wide local history store
+def get_history_store() -> HistoryStore:
+    global _store
+    if _store is None:
+        with _writer_lock:
+            if _store is None:
+                _store = HistoryStore()
+    return _store
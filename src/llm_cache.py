@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from src.config import cache_dir, env_float, env_int, env_str
+
+# Leading words that change the phrasing of a question but not what is being asked
+FILLER_WORDS = {"please", "kindly", "can", "could", "would", "you", "show", "me", "give", "tell", "the", "a", "an"}
+CONTRACTIONS = {"whats": "what is", "hows": "how is", "whos": "who is", "wheres": "where is", "dont": "do not", "doesnt": "does not", "isnt": "is not"}
+# Quoted literals ('SHIPPED', "Acme", curly quotes) are case-sensitive values, so they are kept verbatim
+QUOTED_LITERAL = re.compile(r"""(?<!\w)(?:'(?:[^']|'')*'|"[^"]*"|\u2018[^\u2019]*\u2019|\u201c[^\u201d]*\u201d)""")
+
+
+# Only case and whitespace are folded (plus contractions): operators such as != * / + ( change what is asked
+def _normalize_words(text: str) -> list:
+    words = []
+    for word in text.lower().split():
+        expanded = CONTRACTIONS.get(word.replace("'", "").replace("\u2019", ""))
+        words.extend(expanded.split() if expanded else [word])
+    return words
+
+
+# Same question asked with different casing, spacing, a trailing "?" or leading filler words -> same key
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", str(question))
+    words, position = [], 0
+    for match in QUOTED_LITERAL.finditer(text):
+        words.extend(_normalize_words(text[position:match.start()]))
+        words.append(match.group())
+        position = match.end()
+    words.extend(_normalize_words(re.sub(r"[?.\s]+$", "", text[position:])))
+    start = 0
+    while start < len(words) and words[start].rstrip(",") in FILLER_WORDS:
+        start += 1
+    return " ".join(words[start:])
+
+
+def fingerprint(text) -> str:
+    return hashlib.sha256(str(text).encode()).hexdigest()
+
+
+# Key = prompt template + model + temperature + normalized question + schema-summary hash + remaining inputs
+def llm_cache_key(template_string: str, model: str, temperature: float, inputs: dict) -> str:
+    parts = {"template": fingerprint(template_string), "model": model, "temperature": float(temperature)}
+    for name, value in sorted(inputs.items()):
+        parts[name] = normalize_question(value) if name == "question" else fingerprint(value)
+    return fingerprint(json.dumps(parts, sort_keys=True))
+
+
+class MemoryBackend:
+    """In-process LRU store."""
+
+    def __init__(self):
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0], item[1]
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self.delete(key, locked=True)
+            self._items[key] = (value, time.time())
+            self._bytes += len(value.encode())
+
+    def delete(self, key: str, locked: bool = False) -> None:
+        if not locked:
+            with self._lock:
+                return self.delete(key, locked=True)
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[0].encode())
+
+    def evict(self, max_entries: int, max_bytes: int, ttl_seconds: float) -> int:
+        evicted = 0
+        with self._lock:
+            cutoff = time.time() - ttl_seconds
+            for key in [k for k, (_, created_at) in self._items.items() if created_at < cutoff]:
+                self.delete(key, locked=True)
+                evicted += 1
+            while self._items and (len(self._items) > max_entries or self._bytes > max_bytes):
+                self.delete(next(iter(self._items)), locked=True)
+                evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def size(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes}
+
+
+class SQLiteBackend:
+    """Durable store shared by every process on the host; LRU via accessed_at."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(cache_dir(), "llm_responses.sqlite")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY, value TEXT,
+                    created_at REAL, accessed_at REAL, size_bytes INTEGER
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM llm_responses WHERE key=?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE llm_responses SET accessed_at=? WHERE key=?", (time.time(), key))
+        return row
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, len(value.encode())),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_responses WHERE key=?", (key,))
+
+    def evict(self, max_entries: int, max_bytes: int, ttl_seconds: float) -> int:
+        with self._connect() as conn:
+            evicted = conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (time.time() - ttl_seconds,)).rowcount
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_responses").fetchone()
+            if entries > max_entries or total > max_bytes:
+                for key, size in conn.execute("SELECT key, size_bytes FROM llm_responses ORDER BY accessed_at").fetchall():
+                    if entries <= max_entries and total <= max_bytes:
+                        break
+                    conn.execute("DELETE FROM llm_responses WHERE key=?", (key,))
+                    entries, total, evicted = entries - 1, total - size, evicted + 1
+        return evicted
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_responses")
+
+    def size(self) -> dict:
+        with self._connect() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_responses").fetchone()
+        return {"entries": entries, "bytes": total}
+
+
+class LLMResponseCache:
+    """JSON-serialisable LLM responses behind a pluggable backend, with TTL, LRU size caps and hit-rate counters."""
+
+    def __init__(self, backend=None, ttl_seconds: float = None, max_entries: int = None, max_bytes: int = None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl_seconds = env_float("SQLGEN_LLM_CACHE_TTL", 7 * 24 * 3600) if ttl_seconds is None else ttl_seconds
+        self.max_entries = env_int("SQLGEN_LLM_CACHE_MAX_ENTRIES", 5000) if max_entries is None else max_entries
+        self.max_bytes = env_int("SQLGEN_LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024) if max_bytes is None else max_bytes
+        self._counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "writes": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[key] += amount
+
+    def get(self, key: str):
+        item = self.backend.get(key)
+        if item is None:
+            self._count("misses")
+            return None
+        value, created_at = item
+        if time.time() - created_at > self.ttl_seconds:
+            self.backend.delete(key)
+            self._count("expired")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(value)
+
+    def put(self, key: str, value) -> None:
+        self.backend.put(key, json.dumps(value))
+        self._count("writes")
+        self._count("evictions", self.backend.evict(self.max_entries, self.max_bytes, self.ttl_seconds))
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        return {**counters, **self.backend.size()}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_bypass = ContextVar("sqlgen_llm_cache_bypass", default=False)
+
+
+# Process-wide cache; SQLGEN_LLM_CACHE_BACKEND is sqlite (default), memory or none
+def get_llm_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = env_str("SQLGEN_LLM_CACHE_BACKEND", "sqlite")
+                if backend == "none":
+                    return None
+                _cache = LLMResponseCache(SQLiteBackend() if backend == "sqlite" else MemoryBackend())
+    return _cache
+
+
+# Swap the cache (e.g. a MemoryBackend in tests or benchmarks); None restores the configured default
+def set_llm_cache(cache) -> None:
+    global _cache
+    _cache = cache
+
+
+# Skip cache reads inside the block (used by the "Regenerate" buttons); fresh responses are still stored
+@contextmanager
+def fresh_llm_responses():
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def cache_bypassed() -> bool:
+    return _bypass.get()
@@ -0,0 +1,125 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from src.config import env_float, env_int
+
+
+# Default per-stage timeout (seconds) for the work started by "Proceed"
+def stage_timeout() -> float:
+    return env_float("SQLGEN_STAGE_TIMEOUT", 300.0)
+
+
+class Stage:
+    """One unit of work; it receives the results of `depends_on` stages as positional arguments."""
+
+    def __init__(self, name: str, fn, depends_on=(), timeout: float = None):
+        self.name = name
+        self.fn = fn
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+
+
+# Stage outcome event: {"stage", "status", "result", "error", "seconds"}, as yielded by StageRunner
+def stage_event(name: str, status: str, result=None, error=None, started: float = None) -> dict:
+    seconds = time.monotonic() - started if started else 0.0
+    return {"stage": name, "status": status, "result": result, "error": error, "seconds": seconds}
+
+
+# Run a single stage inline (e.g. a "Regenerate" click) and return its outcome in StageRunner's event shape
+def run_stage(name: str, fn) -> dict:
+    started = time.monotonic()
+    try:
+        return stage_event(name, "done", result=fn(), started=started)
+    except Exception as e:
+        return stage_event(name, "error", error=e, started=started)
+
+
+class StageRunner:
+    """Runs independent stages concurrently and yields each stage's outcome as soon as it is known.
+
+    Events are dicts: {"stage", "status", "result", "error", "seconds"} where status is one of
+    done, error, timeout, skipped (a dependency did not finish) or cancelled.
+    """
+
+    def __init__(self, stages, max_workers: int = None, initializer=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers or env_int("SQLGEN_STAGE_MAX_WORKERS", 4)
+        self.initializer = initializer
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        results, finished = {}, set()
+        running = {}  # future -> (stage name, started, deadline)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sqlgen-stage", initializer=self.initializer)
+
+        def event(name, status, result=None, error=None, started=None):
+            finished.add(name)
+            return stage_event(name, status, result, error, started)
+
+        def submit_ready():
+            blocked = []
+            for name, stage in self.stages.items():
+                if name in finished or name in {n for n, _, _ in running.values()}:
+                    continue
+                if any(dep in finished and dep not in results for dep in stage.depends_on):
+                    blocked.append(event(name, "skipped", error=f"dependency of {name} did not complete"))
+                elif all(dep in results for dep in stage.depends_on):
+                    args = [results[dep] for dep in stage.depends_on]
+                    # run in a copy of the caller's context so context variables (e.g. cache bypass) carry over
+                    context = contextvars.copy_context()
+                    future = executor.submit(context.run, stage.fn, *args)
+                    started = time.monotonic()
+                    timeout = stage.timeout if stage.timeout is not None else stage_timeout()
+                    running[future] = (name, started, started + timeout)
+            return blocked
+
+        try:
+            pending_events = submit_ready()
+            while pending_events or running:
+                for item in pending_events:
+                    yield item
+                pending_events = []
+                if not running:
+                    pending_events = submit_ready()
+                    if not running and not pending_events:
+                        pending_events = [event(name, "skipped", error="unknown dependency") for name in self.stages if name not in finished]
+                    continue
+                if self.cancelled:
+                    for future, (name, started, _) in list(running.items()):
+                        future.cancel()
+                        del running[future]
+                        yield event(name, "cancelled", started=started)
+                    for name in self.stages:
+                        if name not in finished:
+                            yield event(name, "cancelled")
+                    return
+
+                next_deadline = min(deadline for _, _, deadline in running.values())
+                done, _ = wait(running, timeout=max(0.0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, started, _ = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                        pending_events.append(event(name, "done", result=results[name], started=started))
+                    except Exception as e:
+                        pending_events.append(event(name, "error", error=e, started=started))
+                now = time.monotonic()
+                for future, (name, started, deadline) in list(running.items()):
+                    if deadline <= now:
+                        # the worker thread cannot be interrupted; its late result is discarded
+                        future.cancel()
+                        del running[future]
+                        pending_events.append(event(name, "timeout", error=TimeoutError(f"{name} exceeded its timeout"), started=started))
+                pending_events.extend(submit_ready())
+        finally:
+            # Also reached when Streamlit interrupts the script for a rerun
+            self.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
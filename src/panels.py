@@ -0,0 +1,380 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from src.config import env_bool, env_int
+from src.llm_cache import fresh_llm_responses
+from src.orchestrator import Stage, StageRunner, run_stage
+from src.results import result_settings
+from src.telemetry import span
+from src.utils import (
+    generate_erd_mermaid,
+    clear_erd_diagram,
+    render_mermaid_diagram,
+    extract_code_block,
+    summarize_table_pieces,
+    relevant_table_schema,
+    stream_initial_sql,
+    stream_repaired_sql,
+    stream_enhanced_sql,
+    correct_sql_with_budget,
+    generate_sql_speculatively,
+    speculative_enabled,
+    preview_sql_query,
+    preview_followup_query,
+    new_followup_engine,
+    log_user_query,
+    get_user_history,
+    refresh_user_history,
+    get_fav_key,
+    generate_analysis_questions,
+    set_warehouse_user,
+)
+
+# st.fragment from Streamlit 1.37 on, st.experimental_fragment before
+_fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+
+# UI settings: rerun only the panel a widget belongs to (false = every click reruns the whole script)
+# and how many intermediate results (generated SQL, pruned schemas, ...) each session keeps per kind
+def ui_settings() -> dict:
+    return {
+        "fragments": env_bool("SQLGEN_UI_FRAGMENTS", True),
+        "memo_size": env_int("SQLGEN_UI_MEMO_SIZE", 32),
+    }
+
+
+# Queue this browser session's warehouse statements under `user_name` (fair share across users)
+# Kept in session state: fragment reruns and widget callbacks run on a fresh script thread without it
+def set_session_user(user_name) -> None:
+    st.session_state["warehouse_user"] = user_name
+    set_warehouse_user(user_name)
+
+
+def restore_session_user() -> None:
+    if "warehouse_user" in st.session_state:
+        set_warehouse_user(st.session_state["warehouse_user"])
+
+
+# Widget callback that runs under the session's warehouse user
+def session_callback(fn):
+    @functools.wraps(fn)
+    def callback(*args, **kwargs):
+        restore_session_user()
+        return fn(*args, **kwargs)
+
+    return callback
+
+
+# Decorator: a panel of the app that reruns on its own when one of its widgets changes (a Streamlit fragment)
+# Every run is timed as a ui.panel span, so the work behind a click can be told apart from a full rerun
+def panel(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            restore_session_user()
+            with span("ui.panel", panel=name):
+                return fn(*args, **kwargs)
+
+        isolated = _fragment(timed)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return (isolated if ui_settings()["fragments"] else timed)(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# Session-state memo: compute() runs once per key and browser session, later reruns reuse its value
+# refresh=True recomputes it (a "regenerate" click); the oldest keys of a namespace are dropped past memo_size
+def session_memo(namespace: str, key, compute, refresh: bool = False):
+    settings = ui_settings()
+    if not settings["fragments"]:
+        return compute()
+    memo = st.session_state.setdefault(f"memo__{namespace}", OrderedDict())
+    if refresh or key not in memo:
+        memo[key] = compute()
+    memo.move_to_end(key)
+    while len(memo) > max(settings["memo_size"], 1):
+        memo.popitem(last=False)
+    return memo[key]
+
+
+# Warn when the self-correction loop ran out of retries or time
+def show_correction_status(correction):
+    if correction["status"] != "Correct":
+        last = correction["attempts"][-1]
+        st.warning(f"Could not validate the SQL after {correction['repairs']} repair(s) ({correction['status'].lower()}) - {last['failed_stage']} check: {last['error']}")
+
+
+# Prune the schema to the tables/columns the question needs and report the token savings
+def schema_for_question(question, schema_pieces):
+    question_schema, report = session_memo("schema", (question, tuple(sorted(schema_pieces.items()))),
+                                           lambda: relevant_table_schema(question, schema_pieces))
+    used_tables = len(report["tables_full"]) + len(report["tables_compact"])
+    st.caption(f"Schema context: {used_tables}/{report['tables_total']} tables, {report['tokens_after']:,} tokens ({report['tokens_saved']:,} saved)")
+    return question_schema
+
+
+# Draw the SQL inside a streaming LLM response as it arrives (redraws throttled); returns the full text
+def stream_sql(placeholder, chunks):
+    text, last_draw = "", 0.0
+    for chunk in chunks:
+        text += chunk
+        if time.perf_counter() - last_draw > 0.05:
+            placeholder.code(extract_code_block(text, 'sql'), language="sql")
+            last_draw = time.perf_counter()
+    placeholder.code(extract_code_block(text, 'sql'), language="sql")
+    return text
+
+
+# Stream the generated SQL, then self-correct it with each repair streamed into the same placeholder
+# With speculative=True the stream is skipped: parallel candidates race and the first valid one is shown
+# The corrected SQL is memoized per question and schema, so reruns redraw it without generating or validating again
+# (chunks is a lazy generator: nothing is sent to the LLM unless it is consumed)
+def stream_and_correct_sql(question, question_schema, chunks, speculative=False, base_sql=None):
+    sql_panel = st.empty()
+    repair_fn = lambda *args: stream_sql(sql_panel, stream_repaired_sql(*args))
+
+    def generate():
+        if speculative:
+            with st.spinner("Generating SQL candidates..."):
+                correction = generate_sql_speculatively(question, question_schema, repair_fn=repair_fn)
+            correction["caption"] = f"SQL strategy: {correction['strategy']} ({len(correction['launched'])} candidate(s) launched)"
+            return correction
+        response = stream_sql(sql_panel, chunks)
+        return correct_sql_with_budget(question, extract_code_block(response, 'sql'), question_schema, repair_fn=repair_fn)
+
+    correction = session_memo("sql", (question, question_schema, base_sql, speculative), generate)
+    if correction.get("caption"):
+        st.caption(correction["caption"])
+    sql_panel.code(correction["sql"], language="sql")
+    show_correction_status(correction)
+    return correction["sql"]
+
+
+# Call fn, skipping LLM cache reads when the user asked for a fresh answer
+def call_with_fresh_llm(fresh, fn, *args):
+    if not fresh:
+        return fn(*args)
+    with fresh_llm_responses():
+        return fn(*args)
+
+
+# Show the first page of a query result right away and fetch more rows on demand
+# preview_fn(sql, rows, offset) fetches one page (preview_sql_query unless the query is a follow-up)
+# "Load more rows" fetches only the next page in a callback and appends it to the rows already shown,
+# so only the panel around the preview reruns; the shown rows stay under SQLGEN_RESULT_MAX_BYTES
+def show_result_preview(container, sql, key, preview_fn=preview_sql_query):
+    settings = result_settings()
+    page_rows = settings["preview_rows"]
+    rows_key = f"preview_rows__{key}__{hashlib.md5(sql.encode()).hexdigest()}"
+    if rows_key not in st.session_state:
+        st.session_state[rows_key] = preview_fn(sql, page_rows, 0)
+
+    def load_more():
+        shown = st.session_state[rows_key]
+        page = preview_fn(sql, page_rows, len(shown))
+        df = pd.concat([shown, page], ignore_index=True)
+        size = int(shown.attrs.get("bytes") or 0) + int(page.attrs.get("bytes") or 0)
+        truncated = bool(page.attrs.get("truncated")) or size >= settings["max_bytes"]
+        df.attrs.update(shown.attrs)
+        df.attrs.update(has_more=bool(page.attrs.get("has_more")) and not truncated, truncated=truncated, bytes=size)
+        st.session_state[rows_key] = df
+
+    df = st.session_state[rows_key]
+    container.write(df)
+    if df.attrs.get("truncated"):
+        container.caption(f"Showing {len(df)} rows - result truncated at the memory cap")
+    elif df.attrs.get("has_more"):
+        container.button("Load more rows", key=f"more__{rows_key}", on_click=session_callback(load_more))
+    return df
+
+
+# Follow-up engine of this browser session; its MASTER materializations are dropped when the session ends
+def session_followup_engine():
+    if "followup_engine" not in st.session_state:
+        st.session_state["followup_engine"] = new_followup_engine()
+    return st.session_state["followup_engine"]
+
+
+# Preview a follow-up query over the materialized result of the query it builds on
+def show_followup_preview(container, base_sql, followup_sql, key):
+    engine = session_followup_engine()
+    df = show_result_preview(container, followup_sql, key, lambda sql, rows, offset: preview_followup_query(engine, base_sql, sql, rows, offset))
+    where = df.attrs.get("followup", {})
+    if where.get("mode") in ("local", "warehouse"):
+        container.caption(f"Ran on the materialized base result ({where['mode']}, {where['rows']:,} rows)")
+
+
+# "Save to Favourites" button with one flag per question
+# A save reruns the whole app once, so the Favourites tab and the sidebar list pick it up
+def favourite_button(container, name, question, sql, key, catalog, schema):
+    fav_key = get_fav_key(question)
+    if fav_key not in st.session_state:
+        st.session_state[fav_key] = False
+    if container.button("⭐ Save to Favourites", key=f"{key}-{fav_key}") and not st.session_state[fav_key]:
+        log_user_query(name, question, sql, is_favorite=True, catalog=catalog, schema=schema)
+        st.session_state[fav_key] = "saved"
+        st.rerun()
+    elif st.session_state[fav_key] == "saved":
+        st.session_state[fav_key] = True
+        container.success("Added to Favourites")
+    elif st.session_state[fav_key]:
+        container.info("✅ Already saved")
+
+
+# ER diagram, schema summary and analysis ideas for the selected tables, computed concurrently once per selection
+# Returns the stage outcomes; panels replace single outcomes in place when the user regenerates them
+# on_erd(outcomes) is called as soon as the ER diagram stage finishes, before the slower stages are done
+def prepare_selection(catalog, schema, table_list, on_erd=None) -> dict:
+    def prepare():
+        script_ctx = get_script_run_ctx()
+        runner = StageRunner([
+            Stage("erd", lambda: generate_erd_mermaid(catalog, schema, table_list)),
+            Stage("schema", lambda: summarize_table_pieces(catalog, schema, table_list)),
+            Stage("questions", lambda pieces: generate_analysis_questions("".join(pieces.values())), depends_on=["schema"]),
+        ], initializer=lambda: add_script_run_ctx(threading.current_thread(), script_ctx))
+        outcomes = {}
+        with st.spinner("Preparing the ER diagram, schema summary and analysis ideas..."):
+            for outcome in runner.run():
+                outcomes[outcome["stage"]] = outcome
+                if outcome["stage"] == "erd" and on_erd is not None:
+                    on_erd(outcomes)
+        if outcomes["schema"]["status"] != "done":
+            # not memoized: the next rerun tries again
+            st.error(f"Could not summarize the selected tables ({outcomes['schema']['status']}): {outcomes['schema']['error']}")
+            st.stop()
+        return outcomes
+
+    return session_memo("prepare", (catalog, schema, tuple(table_list)), prepare)
+
+
+@panel("erd")
+def erd_panel(outcomes, catalog, schema, table_list):
+    erd_expander = st.expander(":orange[View the ER Diagram]")
+    if erd_expander.button("Regenerate"):
+        clear_erd_diagram(catalog, schema, table_list)
+        outcomes["erd"] = run_stage("erd", lambda: call_with_fresh_llm(True, generate_erd_mermaid, catalog, schema, table_list))
+    with erd_expander:
+        # Creating the ER Diagram
+        if outcomes["erd"]["status"] == "done":
+            render_mermaid_diagram(outcomes["erd"]["result"])
+        else:
+            st.error(f"ER diagram unavailable ({outcomes['erd']['status']}): {outcomes['erd']['error']}")
+
+
+@panel("quick_analysis")
+def quick_analysis_panel(outcomes, name, catalog, schema):
+    st.markdown("<h4 style='text-align: left; color: orange;'> Quick business focued questions based on selected choices </h4>", unsafe_allow_html=True)
+    table_schema_pieces = outcomes["schema"]["result"]
+    if st.button("💡 Need New Analysis Ideas"):
+        generate_analysis_questions.clear()
+        outcomes["questions"] = run_stage("questions", lambda: call_with_fresh_llm(True, generate_analysis_questions, "".join(table_schema_pieces.values())))
+    if outcomes["questions"]["status"] == "done":
+        questions = outcomes["questions"]["result"]['text']['business_questions']
+    else:
+        st.error(f"Could not generate analysis ideas ({outcomes['questions']['status']}): {outcomes['questions']['error']}")
+        questions = []
+    selected_question = st.selectbox("Pick a question to analyze", options=questions)
+    if selected_question and st.checkbox('Analyze this question'):
+        st.write(f'#### {selected_question}')
+        qa_schema = schema_for_question(selected_question, table_schema_pieces)
+        # SQL is drawn while it streams in, then self-corrected in place
+        response_sql_qa = stream_and_correct_sql(selected_question, qa_schema, stream_initial_sql(selected_question, qa_schema), speculative=speculative_enabled())
+
+        col1, col2 = st.columns(2)
+        if col1.checkbox("Preview Sample Data", key="d-1024"):
+            show_result_preview(col1, response_sql_qa, "d-1024")
+        favourite_button(col2, name, selected_question, response_sql_qa, "d-133", catalog, schema)
+
+
+@panel("favourites")
+def favourites_panel(name, catalog, schema):
+    st.markdown("<h2 style='text-align: left; color: orange;'> Your Favourite </h2>", unsafe_allow_html=True)
+    # Refresh button to reload the latest favourites from the database (the sidebar list refreshes with it)
+    if st.button("🔄 Refresh Favourites", key="refresh_fav"):
+        refresh_user_history(name)
+        st.rerun()
+
+    fav_df = get_user_history(user_name=name, selected_schema=schema, catalog=catalog)
+    if fav_df.empty:
+        st.info("No saved queries yet.")
+        return
+    # let the user pick one of their saved questions
+    fav_question = st.selectbox(
+        "Select the question",
+        options=fav_df['question'].unique().tolist(),
+        key="fav_select"
+    )
+    fav_sql = fav_df[fav_df['question']==fav_question]['query'].values[0]
+
+    st.write(f"#### {fav_question}")
+    st.code(fav_sql)
+
+    col1, col2 = st.columns(2)
+    # preview sample data
+    if col1.checkbox("Query Sample Data", key="sample_key"):
+        show_result_preview(col1, fav_sql, "sample_key")
+
+
+@panel("deep_analysis")
+def deep_analysis_panel(outcomes, name, catalog, schema):
+    st.markdown("<h2 style='text-align: left; color: orange;'> Deep Analysis - Ask any custom business question </h2>", unsafe_allow_html=True)
+    table_schema_pieces = outcomes["schema"]["result"]
+    d_question = st.text_area("Enter a deep-dive question here..")
+
+    if not st.checkbox("Generate SQL", key="dd-10001"):
+        return
+    d_schema = schema_for_question(d_question, table_schema_pieces)
+    # SQL is drawn while it streams in, then self-corrected in place
+    response_sql_1 = stream_and_correct_sql(d_question, d_schema, stream_initial_sql(d_question, d_schema), speculative=speculative_enabled())
+
+    col1, col2 = st.columns(2)
+    if col1.checkbox("Query Sample Data", key="d-102"):
+        show_result_preview(col1, response_sql_1, "d-102")
+    favourite_button(col2, name, d_question, response_sql_1, "d-13", catalog, schema)
+
+    #Building on top of existing query
+    if not col1.checkbox("Build on top of this result?", key='d-21'):
+        return
+    d_question_2 = st.text_area("Enter your question here...", key='d-23')
+    if st.checkbox("Generate SQL", key='d-24'):
+        d_schema_2 = schema_for_question(f"{d_question} {d_question_2}", table_schema_pieces)
+        response_sql_2 = stream_and_correct_sql(d_question_2, d_schema_2, stream_enhanced_sql(d_question_2, d_schema_2, response_sql_1), base_sql=response_sql_1)
+
+        col1, col2 = st.columns(2)
+        if col1.checkbox("Query Sample Data", key='d-25'):
+            show_followup_preview(col1, response_sql_1, response_sql_2, "d-25")
+        favourite_button(col2, name, d_question_2, response_sql_2, "d-143", catalog, schema)
+
+
+# The analysis area for the selected tables: ER diagram and the three tabs, each rerunning on its own
+def render_analysis(name, catalog, schema, table_list) -> None:
+    erd_slot = st.container()
+    drawn = []
+
+    def draw_erd(outcomes):
+        with erd_slot:
+            erd_panel(outcomes, catalog, schema, table_list)
+        drawn.append(True)
+
+    # the ER diagram is drawn while the schema summary and analysis ideas are still being prepared
+    outcomes = prepare_selection(catalog, schema, table_list, on_erd=draw_erd)
+    if not drawn:
+        draw_erd(outcomes)
+
+    # Tabs for analysis modes
+    tab1, tab2, tab3 = st.tabs(["🔍 Quick Analysis", "⭐ Favourites","📊 Deep Analysis",])
+    with tab1:
+        quick_analysis_panel(outcomes, name, catalog, schema)
+    with tab2:
+        favourites_panel(name, catalog, schema)
+    with tab3:
+        deep_analysis_panel(outcomes, name, catalog, schema)
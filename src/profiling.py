@@ -0,0 +1,93 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import pandas as pd
+from src.config import env_float, env_int, env_str
+
+NO_CATEGORICAL = "No Categorical Fields"
+PROFILE_SKIPPED = "Categorical profiling skipped (time budget exceeded)"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# Profiling pool, created on first use so importing this module starts no threads
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=env_int("SQLGEN_PROFILING_MAX_WORKERS", 8), thread_name_prefix="sqlgen-profile")
+    return _executor
+
+
+# Categorical profiling settings: "sampled" never scans more than row_budget rows, "exact" is the original full scan
+def profiling_settings() -> dict:
+    return {
+        "mode": env_str("SQLGEN_PROFILING_MODE", "sampled"),
+        "sample": env_str("SQLGEN_PROFILING_SAMPLE", "limit"),
+        "row_budget": env_int("SQLGEN_PROFILING_ROW_BUDGET", 100000),
+        "time_budget": env_float("SQLGEN_PROFILING_TIME_BUDGET", 30.0),
+        "max_values": env_int("SQLGEN_CATEGORICAL_MAX_VALUES", 20),
+    }
+
+
+# One pass over a bounded sample: approximate NDV plus at most max_values + 1 distinct values per column
+def sampled_profile_query(table_ref: str, columns: list, row_budget: int, max_values: int, sample: str = "limit") -> str:
+    selects = []
+    for i, col in enumerate(columns):
+        selects.append(f"approx_count_distinct(`{col}`) AS c{i}_ndv")
+        selects.append(f"slice(collect_set(`{col}`), 1, {max_values + 1}) AS c{i}_values")
+    if sample == "tablesample":
+        source = f"{table_ref} TABLESAMPLE ({row_budget} ROWS)"
+    else:
+        # LIMIT without ORDER BY lets the warehouse stop reading once the budget is reached
+        source = f"(SELECT {', '.join(f'`{col}`' for col in columns)} FROM {table_ref} LIMIT {row_budget}) AS sampled"
+    return f"SELECT {', '.join(selects)} FROM {source}"
+
+
+# Original full-table COUNT(DISTINCT) / ARRAY_AGG(DISTINCT) scan, kept for SQLGEN_PROFILING_MODE=exact
+def exact_profile_query(table_ref: str, columns: list) -> str:
+    return " UNION ALL ".join(
+        f"SELECT '{col}' AS column_name, COUNT(DISTINCT {col}) AS cnt, ARRAY_AGG(DISTINCT {col}) AS values FROM {table_ref}"
+        for col in columns
+    )
+
+
+def _sampled_frame(row: pd.Series, columns: list, max_values: int) -> pd.DataFrame:
+    records = []
+    for i, col in enumerate(columns):
+        values = row[f"c{i}_values"]
+        values = [] if values is None else list(values)
+        # approx NDV can undercount, so the capped value list is the final word on cardinality
+        if row[f"c{i}_ndv"] <= max_values and len(values) <= max_values:
+            records.append({"column_name": col, "values": sorted(values, key=str)})
+    return pd.DataFrame(records, columns=["column_name", "values"])
+
+
+# Low-cardinality string columns as text; returns (cat_info, complete) where complete=False means the budget ran out
+def profile_categorical(query_fn, table_ref: str, columns: list, settings: dict = None):
+    settings = settings or profiling_settings()
+    if not columns:
+        return NO_CATEGORICAL, True
+    max_values = settings["max_values"]
+    if settings["mode"] == "exact":
+        query = exact_profile_query(table_ref, columns)
+    else:
+        query = sampled_profile_query(table_ref, columns, settings["row_budget"], max_values, settings["sample"])
+
+    # a context copy keeps the query under the session user (scheduler fairness) and inside the caller's span;
+    # the budget is also the statement timeout, so a query that overruns it is cancelled on the warehouse
+    # instead of holding a scheduler slot after we stop waiting for it
+    future = _get_executor().submit(contextvars.copy_context().run, query_fn, query, timeout=settings["time_budget"])
+    try:
+        df = future.result(timeout=settings["time_budget"])
+    except FutureTimeout:
+        future.cancel()
+        return PROFILE_SKIPPED, False
+
+    if settings["mode"] == "exact":
+        df_cat = df[df["cnt"] <= max_values].drop(columns="cnt")
+    else:
+        df_cat = _sampled_frame(df.iloc[0], columns, max_values)
+    return (df_cat.to_string(index=False) if not df_cat.empty else NO_CATEGORICAL), True
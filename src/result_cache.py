@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from src.config import cache_dir, env_bool, env_float, env_int
+
+
+# Same query written with different whitespace, keyword case or trailing semicolon -> same key
+def normalize_sql(sql: str, dialect: str = "databricks") -> str:
+    sql = sql.strip().rstrip(";").strip()
+    try:
+        # imported on first use, not at app start-up
+        import sqlglot
+    except ImportError:  # SQL normalization falls back to whitespace/case folding
+        sqlglot = None
+    if sqlglot is not None:
+        try:
+            return sqlglot.transpile(sql, read=dialect, write=dialect)[0]
+        except Exception:
+            pass
+    return re.sub(r"\s+", " ", sql)
+
+
+def result_cache_key(sql: str, variant=None, dialect: str = "databricks") -> str:
+    return hashlib.sha256(f"{normalize_sql(sql, dialect)}\x00{variant}".encode()).hexdigest()
+
+
+class ResultCache:
+    """Query result DataFrames held under a byte budget (LRU + TTL), optionally spilling evicted entries to Parquet."""
+
+    def __init__(self, max_bytes: int = None, ttl_seconds: float = None, spill: bool = None, spill_dir: str = None, spill_max_bytes: int = None):
+        self.max_bytes = env_int("SQLGEN_RESULT_CACHE_MAX_BYTES", 512 * 1024 * 1024) if max_bytes is None else max_bytes
+        self.ttl_seconds = env_float("SQLGEN_RESULT_CACHE_TTL", 900.0) if ttl_seconds is None else ttl_seconds
+        self.spill = env_bool("SQLGEN_RESULT_CACHE_SPILL", False) if spill is None else spill
+        self.spill_max_bytes = env_int("SQLGEN_RESULT_CACHE_SPILL_MAX_BYTES", 2 * 1024 * 1024 * 1024) if spill_max_bytes is None else spill_max_bytes
+        self.spill_dir = spill_dir or os.path.join(cache_dir(), "results")
+        self._memory = OrderedDict()  # key -> (df, bytes, created_at)
+        self._spilled = OrderedDict()  # key -> (path, bytes, created_at, attrs)
+        self._memory_bytes = 0
+        self._spilled_bytes = 0
+        self._counters = {"hits": 0, "spill_hits": 0, "misses": 0, "expired": 0, "evictions": 0, "spills": 0, "oversized": 0}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def frame_bytes(df) -> int:
+        return int(df.memory_usage(deep=True).sum())
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                df, _, created_at = self._memory[key]
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return df.copy(deep=False)
+                self._drop_memory(key)
+                self._counters["expired"] += 1
+            if key in self._spilled:
+                df = self._load_spilled(key, now)
+                if df is not None:
+                    self._counters["spill_hits"] += 1
+                    return df.copy(deep=False)
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key: str, df, created_at: float = None) -> None:
+        size = self.frame_bytes(df)
+        with self._lock:
+            self._drop_memory(key)
+            self._drop_spilled(key)
+            if size > self.max_bytes:
+                # would evict everything else and still not fit
+                self._counters["oversized"] += 1
+                return
+            self._memory[key] = (df, size, created_at or time.time())
+            self._memory_bytes += size
+            self._evict()
+
+    def _drop_memory(self, key: str) -> None:
+        item = self._memory.pop(key, None)
+        if item is not None:
+            self._memory_bytes -= item[1]
+
+    def _drop_spilled(self, key: str) -> None:
+        item = self._spilled.pop(key, None)
+        if item is not None:
+            self._spilled_bytes -= item[1]
+            try:
+                os.remove(item[0])
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        for key in [k for k, (_, _, created_at) in self._memory.items() if created_at < cutoff]:
+            self._drop_memory(key)
+            self._counters["expired"] += 1
+        while self._memory_bytes > self.max_bytes and self._memory:
+            key, (df, size, created_at) = next(iter(self._memory.items()))
+            self._drop_memory(key)
+            self._counters["evictions"] += 1
+            if self.spill:
+                self._spill(key, df, size, created_at)
+
+    def _spill(self, key: str, df, size: int, created_at: float) -> None:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{key}.parquet")
+        try:
+            df.to_parquet(path, index=False)
+        except Exception:
+            # e.g. mixed-type object columns Parquet cannot represent; the entry is simply dropped
+            return
+        self._spilled[key] = (path, size, created_at, json.dumps(df.attrs, default=str))
+        self._spilled_bytes += size
+        self._counters["spills"] += 1
+        while self._spilled_bytes > self.spill_max_bytes and self._spilled:
+            self._drop_spilled(next(iter(self._spilled)))
+
+    def _load_spilled(self, key: str, now: float):
+        path, _, created_at, attrs = self._spilled[key]
+        if now - created_at > self.ttl_seconds:
+            self._drop_spilled(key)
+            self._counters["expired"] += 1
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except Exception:
+            self._drop_spilled(key)
+            return None
+        df.attrs.update(json.loads(attrs))
+        self._drop_spilled(key)
+        self.put(key, df, created_at)
+        return df
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for key in list(self._spilled):
+                self._drop_spilled(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["spill_hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": (self._counters["hits"] + self._counters["spill_hits"]) / lookups if lookups else 0.0,
+                "entries": len(self._memory),
+                "bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "spilled_entries": len(self._spilled),
+                "spilled_bytes": self._spilled_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Process-wide result cache shared by every session and tab
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
+
+
+def set_result_cache(cache) -> None:
+    global _cache
+    _cache = cache
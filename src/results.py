@@ -0,0 +1,114 @@
+import pandas as pd
+from src.config import env_int, env_str
+from src.engine import engine_connection
+
+
+# Result fetching settings: preview page size, fetch batch size and the per-result memory cap
+def result_settings() -> dict:
+    return {
+        "preview_rows": env_int("SQLGEN_PREVIEW_ROWS", 100),
+        "batch_rows": env_int("SQLGEN_FETCH_BATCH_ROWS", 10000),
+        "max_bytes": env_int("SQLGEN_RESULT_MAX_BYTES", 200 * 1024 * 1024),
+        "dialect": env_str("SQLGEN_SQL_DIALECT", "databricks"),
+    }
+
+
+def _wrap_with_limit(sql: str, limit: int, offset: int = 0) -> str:
+    return f"SELECT * FROM ({sql}) AS sqlgen_preview LIMIT {limit}" + (f" OFFSET {offset}" if offset else "")
+
+
+# Push a row limit (and the offset of a later page) into the SQL itself so the warehouse stops early
+# keeps a tighter existing LIMIT; a query that already has a LIMIT or OFFSET is paged as a subquery
+def limit_query(sql: str, limit: int, dialect: str = "databricks", offset: int = 0) -> str:
+    sql = sql.strip().rstrip(";").strip()
+    try:
+        # imported on first use, not at app start-up
+        import sqlglot
+        from sqlglot import exp
+    except ImportError:  # row limits fall back to wrapping the query in a subquery
+        return _wrap_with_limit(sql, limit, offset)
+    try:
+        tree = sqlglot.parse_one(sql, read=dialect)
+    except Exception:
+        return _wrap_with_limit(sql, limit, offset)
+    if not isinstance(tree, (exp.Select, exp.Union)):
+        return _wrap_with_limit(sql, limit, offset)
+    existing = tree.args.get("limit")
+    if offset:
+        if existing is not None or tree.args.get("offset") is not None or not isinstance(tree, exp.Select):
+            return _wrap_with_limit(sql, limit, offset)
+        return tree.limit(limit, copy=False).offset(offset, copy=False).sql(dialect=dialect)
+    if existing is not None:
+        current = existing.expression
+        if isinstance(current, exp.Literal) and current.is_int and int(current.this) <= limit:
+            return sql
+    return tree.limit(limit, copy=False).sql(dialect=dialect)
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+# Stream a query result as DataFrame batches (Arrow batches when the driver supports them)
+def iter_result_batches(sql: str, batch_rows: int = None):
+    batch_rows = batch_rows or result_settings()["batch_rows"]
+    with engine_connection() as conn:
+        result = conn.execution_options(stream_results=True).exec_driver_sql(sql)
+        cursor = result.cursor
+        columns = list(result.keys())
+        yielded = False
+        try:
+            if hasattr(cursor, "fetchmany_arrow"):
+                while True:
+                    table = cursor.fetchmany_arrow(batch_rows)
+                    if table.num_rows == 0:
+                        break
+                    yielded = True
+                    yield table.to_pandas()
+            else:
+                while True:
+                    rows = result.fetchmany(batch_rows)
+                    if not rows:
+                        break
+                    yielded = True
+                    yield pd.DataFrame(rows, columns=columns)
+            if not yielded:
+                yield pd.DataFrame(columns=columns)
+        finally:
+            result.close()
+
+
+# Fetch up to `limit` rows (all when None) without holding more than max_bytes in memory
+# offset skips the rows of earlier pages (with a limit only); pages of a query without ORDER BY follow the warehouse's scan order
+# attrs: has_more (rows were left unread), truncated (stopped by the memory cap), bytes
+def fetch_result(sql: str, limit: int = None, max_bytes: int = None, batch_rows: int = None, offset: int = 0) -> pd.DataFrame:
+    settings = result_settings()
+    max_bytes = max_bytes or settings["max_bytes"]
+    # One extra row tells the UI whether another page exists
+    query = limit_query(sql, limit + 1, settings["dialect"], offset) if limit else sql
+    frames, rows, size = [], 0, 0
+    has_more, truncated = False, False
+    batches = iter_result_batches(query, batch_rows)
+    try:
+        for batch in batches:
+            if limit and rows + len(batch) > limit:
+                batch = batch.iloc[: limit - rows]
+                has_more = True
+            batch_bytes = _frame_bytes(batch)
+            if size + batch_bytes > max_bytes:
+                # keep the rows of this batch that still fit under the cap
+                keep = int(len(batch) * max(0, max_bytes - size) / max(batch_bytes, 1))
+                batch = batch.iloc[:keep]
+                batch_bytes = _frame_bytes(batch)
+                has_more = truncated = True
+            frames.append(batch)
+            rows += len(batch)
+            size += batch_bytes
+            if has_more:
+                break
+    finally:
+        # releases the cursor and pooled connection as soon as we stop reading
+        batches.close()
+    df = pd.concat(frames, ignore_index=True)
+    df.attrs.update(has_more=has_more, truncated=truncated, bytes=size)
+    return df
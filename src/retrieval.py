@@ -0,0 +1,156 @@
+import math
+import re
+import threading
+from collections import Counter
+from src.config import env_bool, env_int
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+# Column names that usually carry joins; kept whenever a table is included in compact form
+KEY_COLUMN_PATTERN = re.compile(r"(^id$|_id$|_key$|_sk$|^key$)", re.IGNORECASE)
+TABLE_NAME_PATTERN = re.compile(r"CREATE\s+(?:OR\s+REPLACE\s+)?(?:TEMPORARY\s+)?(?:TABLE|VIEW)\s+(?:IF\s+NOT\s+EXISTS\s+)?([^\s(]+)", re.IGNORECASE)
+COLUMN_LINE_PATTERN = re.compile(r"^\s*`?([A-Za-z_][\w]*)`?\s+([A-Za-z]+(?:<[^>]*>|\([^)]*\))?)")
+
+
+# Schema pruning settings: on/off, token budget for the schema context and how many tables are always kept
+def retrieval_settings() -> dict:
+    return {
+        "enabled": env_bool("SQLGEN_SCHEMA_PRUNING", True),
+        "token_budget": env_int("SQLGEN_SCHEMA_TOKEN_BUDGET", 6000),
+        "min_tables": env_int("SQLGEN_SCHEMA_MIN_TABLES", 1),
+    }
+
+
+# Token count with the model's tokenizer when tiktoken has its encoding locally, ~4 chars/token otherwise
+def count_tokens(text: str) -> int:
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.get_encoding("o200k_base")
+                except Exception:
+                    # no network / no cached encoding: remember the failure instead of retrying on every call
+                    _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text))
+    return max(1, len(text) // 4) if text else 0
+
+
+# Lowercased word pieces: splits snake_case, camelCase and punctuation, with light plural stemming
+def tokenize(text: str) -> list:
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(text))
+    words = re.split(r"[^A-Za-z0-9]+", text.lower())
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words if w]
+
+
+# Column names and types declared in the SHOW CREATE TABLE part of a table summary
+def parse_columns(summary: str) -> list:
+    columns, started = [], False
+    for line in summary.splitlines():
+        if not started:
+            started = "CREATE" in line.upper() and "(" in line
+            continue
+        stripped = line.strip()
+        if stripped.startswith(")"):
+            break
+        match = COLUMN_LINE_PATTERN.match(line)
+        if match and match.group(1).upper() not in ("CONSTRAINT", "PRIMARY", "FOREIGN"):
+            columns.append((match.group(1), match.group(2)))
+        if stripped.count(")") > stripped.count("("):
+            break
+    return columns
+
+
+class SchemaIndex:
+    """BM25 index over per-table schema summaries (table name, columns, categorical values)."""
+
+    def __init__(self, pieces: dict, k1: float = 1.5, b: float = 0.75):
+        self.pieces = pieces
+        self.k1, self.b = k1, b
+        self.columns = {table: parse_columns(summary) for table, summary in pieces.items()}
+        self.qualified_names = {}
+        for table, summary in pieces.items():
+            match = TABLE_NAME_PATTERN.search(summary)
+            self.qualified_names[table] = match.group(1) if match else table
+        self.doc_terms = {}
+        for table, summary in pieces.items():
+            # the table name is weighted up: questions usually name the entity they are about
+            self.doc_terms[table] = Counter(tokenize(table) * 3 + tokenize(summary))
+        self.avg_len = sum(sum(t.values()) for t in self.doc_terms.values()) / max(len(pieces), 1)
+        df = Counter(term for terms in self.doc_terms.values() for term in terms)
+        n = len(pieces)
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def score(self, question: str) -> dict:
+        query = tokenize(question)
+        scores = {}
+        for table, terms in self.doc_terms.items():
+            length = sum(terms.values())
+            score = 0.0
+            for term in query:
+                tf = terms.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / self.avg_len))
+            scores[table] = score
+        return scores
+
+    # Compact "table(col type, ...)" with the question's columns plus join keys
+    def compact(self, table: str, question: str) -> str:
+        query = set(tokenize(question))
+        kept = [
+            f"{name} {col_type}" for name, col_type in self.columns[table]
+            if KEY_COLUMN_PATTERN.search(name) or query & set(tokenize(name))
+        ] or [f"{name} {col_type}" for name, col_type in self.columns[table][:5]]
+        return f"{self.qualified_names[table]}({', '.join(kept)})\n"
+
+    # Most relevant tables within the token budget; returns (schema_text, report)
+    def prune(self, question: str, token_budget: int, min_tables: int = 1):
+        scores = self.score(question)
+        # nothing matched: keep filling the budget rather than guessing a single table
+        matched = any(score > 0 for score in scores.values())
+        ranked = sorted(self.pieces, key=lambda table: (-scores[table], table))
+        full_tokens = {table: count_tokens(piece) for table, piece in self.pieces.items()}
+        tokens_before = sum(full_tokens.values())
+        selected, used, full, compacted = [], 0, [], []
+        for position, table in enumerate(ranked):
+            if matched and scores[table] <= 0 and position >= min_tables:
+                break
+            if used + full_tokens[table] <= token_budget or position < min_tables:
+                selected.append(self.pieces[table])
+                used += full_tokens[table]
+                full.append(table)
+                continue
+            piece = self.compact(table, question)
+            piece_tokens = count_tokens(piece)
+            if used + piece_tokens <= token_budget:
+                selected.append(piece)
+                used += piece_tokens
+                compacted.append(table)
+        report = {
+            "tables_total": len(self.pieces),
+            "tables_full": full,
+            "tables_compact": compacted,
+            "tokens_before": tokens_before,
+            "tokens_after": used,
+            "tokens_saved": tokens_before - used,
+        }
+        return "".join(selected), report
+
+
+# Schema context for one question; returns (schema_text, report) with token counts before and after pruning
+def prune_schema(question: str, pieces: dict, token_budget: int = None, min_tables: int = None):
+    settings = retrieval_settings()
+    full_schema = "".join(pieces.values())
+    if not settings["enabled"] or not pieces:
+        tokens = count_tokens(full_schema)
+        return full_schema, {"tables_total": len(pieces), "tables_full": list(pieces), "tables_compact": [],
+                             "tokens_before": tokens, "tokens_after": tokens, "tokens_saved": 0}
+    index = SchemaIndex(pieces)
+    return index.prune(
+        question,
+        settings["token_budget"] if token_budget is None else token_budget,
+        settings["min_tables"] if min_tables is None else min_tables,
+    )
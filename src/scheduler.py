@@ -0,0 +1,349 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextvars import ContextVar
+from src.config import env_bool, env_float, env_int
+from src.telemetry import get_telemetry
+
+# Lower runs first: validation probes are cheap and block the UI, full executions can wait
+PRIORITIES = {"probe": 0, "metadata": 1, "query": 2}
+DEFAULT_USER = "shared"
+
+_current_user = ContextVar("sqlgen_query_user", default=DEFAULT_USER)
+_current_ticket = ContextVar("sqlgen_query_ticket", default=None)
+
+
+class QueueTimeout(TimeoutError):
+    """The statement waited longer than SQLGEN_SCHEDULER_QUEUE_TIMEOUT for a warehouse slot."""
+
+
+class QueryTimeout(TimeoutError):
+    """The statement ran longer than its timeout and was cancelled."""
+
+
+class QueryCancelled(RuntimeError):
+    """The statement was cancelled before it finished (see QueryScheduler.cancel)."""
+
+
+# Scheduler settings: on/off, statements running at once, queue / run timeouts (0 = none) and priority aging
+def scheduler_settings() -> dict:
+    return {
+        "enabled": env_bool("SQLGEN_SCHEDULER", True),
+        "max_concurrent": env_int("SQLGEN_SCHEDULER_MAX_CONCURRENT", 4),
+        "queue_timeout": env_float("SQLGEN_SCHEDULER_QUEUE_TIMEOUT", 120.0),
+        "query_timeout": env_float("SQLGEN_SCHEDULER_QUERY_TIMEOUT", 300.0),
+        "probe_timeout": env_float("SQLGEN_SCHEDULER_PROBE_TIMEOUT", 60.0),
+        "metadata_timeout": env_float("SQLGEN_SCHEDULER_METADATA_TIMEOUT", 300.0),
+        "aging_seconds": env_float("SQLGEN_SCHEDULER_AGING", 10.0),
+    }
+
+
+# Scheduling class of a statement: validation probes, catalog lookups, or everything else
+def classify_statement(sql: str) -> str:
+    words = sql.split(None, 1)
+    first = words[0].upper() if words else ""
+    if first == "EXPLAIN" or "AS sqlgen_probe LIMIT 0" in sql:
+        return "probe"
+    if first in ("SHOW", "DESCRIBE", "DESC") or "information_schema" in sql.lower():
+        return "metadata"
+    return "query"
+
+
+# Statements issued from this context are queued under `user` (worker threads inherit it via copied contexts)
+def set_query_user(user: str) -> None:
+    _current_user.set(user or DEFAULT_USER)
+
+
+def current_query_user() -> str:
+    return _current_user.get()
+
+
+# Called by the engine right before a statement starts, so a timeout or cancel can stop it on the warehouse
+def register_cancel(cancel_fn) -> None:
+    ticket = _current_ticket.get()
+    if ticket is not None and cancel_fn is not None:
+        ticket.add_cancel(cancel_fn)
+
+
+class Ticket:
+    """One statement waiting for, or holding, a warehouse slot."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, user: str, kind: str):
+        self.id = next(Ticket._ids)
+        self.user = user
+        self.kind = kind
+        self.priority = PRIORITIES.get(kind, PRIORITIES["query"])
+        self.enqueued_at = time.monotonic()
+        self.state = "queued"
+        self.timed_out = False
+        self.cancelled = False
+        self._cancel_fns = []
+        self._lock = threading.Lock()
+
+    def add_cancel(self, cancel_fn) -> None:
+        with self._lock:
+            self._cancel_fns.append(cancel_fn)
+            stop = self.timed_out or self.cancelled
+        if stop:
+            self._call(cancel_fn)
+
+    def cancel(self) -> None:
+        with self._lock:
+            cancel_fns = list(self._cancel_fns)
+        for cancel_fn in cancel_fns:
+            self._call(cancel_fn)
+
+    @staticmethod
+    def _call(cancel_fn) -> None:
+        try:
+            cancel_fn()
+        except Exception:
+            # the statement may have finished in the meantime
+            pass
+
+
+class _Watchdog:
+    """One daemon thread that fires timeout callbacks at their deadlines (instead of a timer thread per statement)."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._ids = itertools.count()
+        self._thread = None
+
+    def schedule(self, delay: float, callback) -> list:
+        entry = [time.monotonic() + delay, next(self._ids), callback]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="sqlgen-scheduler-watchdog", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    # Cancelled entries stay in the heap and are skipped when they come due
+    @staticmethod
+    def cancel(entry: list) -> None:
+        entry[2] = None
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, callback = heapq.heappop(self._heap)
+            if callback is not None:
+                callback()
+
+
+class QueryScheduler:
+    """Admission control in front of the warehouse.
+
+    At most max_concurrent statements run at once. Waiting statements are served by priority (probe, then
+    metadata, then query) and round-robin across users within a priority, so one user's backlog cannot
+    starve the others; anything queued longer than aging_seconds is served as if it were a probe.
+    Statements run in the caller's thread. A timer cancels a statement that overruns its timeout through
+    the cancel hook the engine registered (cursor.cancel on Databricks, connection.interrupt on SQLite).
+    Identical statements already in flight are not re-run: later callers share the first caller's result.
+    """
+
+    def __init__(self, settings: dict = None):
+        self.settings = {**scheduler_settings(), **(settings or {})}
+        self._cond = threading.Condition()
+        self._queues = {priority: OrderedDict() for priority in sorted(set(PRIORITIES.values()))}  # priority -> user -> deque
+        self._running = set()
+        self._inflight = {}  # dedupe key -> Future of the first caller
+        self._watchdog = _Watchdog()
+        self._counters = {"admitted": 0, "deduplicated": 0, "queue_timeouts": 0, "query_timeouts": 0, "cancelled": 0, "failed": 0}
+
+    def _queued(self) -> int:
+        return sum(len(jobs) for users in self._queues.values() for jobs in users.values())
+
+    def _next(self):
+        now = time.monotonic()
+        best = None
+        for priority, users in self._queues.items():
+            if not users:
+                continue
+            user, jobs = next(iter(users.items()))
+            effective = 0 if now - jobs[0].enqueued_at >= self.settings["aging_seconds"] else priority
+            # among tickets served as probes (aged ones included) the one queued longest goes first,
+            # so steady probe traffic cannot starve an aged query
+            key = (effective, jobs[0].enqueued_at)
+            if best is None or key < best[0]:
+                best = (key, priority, user)
+        if best is None:
+            return None
+        _, priority, user = best
+        users = self._queues[priority]
+        jobs = users.pop(user)
+        ticket = jobs.popleft()
+        if jobs:
+            # back of the rotation: every other user with queued work goes first
+            users[user] = jobs
+        return ticket
+
+    # Grant free slots to waiting tickets (caller holds the condition)
+    def _dispatch(self) -> None:
+        granted = False
+        while len(self._running) < max(self.settings["max_concurrent"], 1):
+            ticket = self._next()
+            if ticket is None:
+                break
+            ticket.state = "running"
+            self._running.add(ticket)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _remove(self, ticket: Ticket) -> None:
+        users = self._queues[ticket.priority]
+        jobs = users.get(ticket.user)
+        if jobs is not None and ticket in jobs:
+            jobs.remove(ticket)
+            if not jobs:
+                del users[ticket.user]
+
+    def _admit(self, ticket: Ticket) -> None:
+        with self._cond:
+            self._queues[ticket.priority].setdefault(ticket.user, deque()).append(ticket)
+            self._dispatch()
+            deadline = ticket.enqueued_at + self.settings["queue_timeout"] if self.settings["queue_timeout"] > 0 else None
+            while ticket.state == "queued":
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._remove(ticket)
+                    self._counters["queue_timeouts"] += 1
+                    raise QueueTimeout(f"Warehouse busy: no free slot after {self.settings['queue_timeout']:g}s")
+                self._cond.wait(remaining)
+            if ticket.state == "cancelled":
+                raise QueryCancelled("Query cancelled while queued")
+            self._counters["admitted"] += 1
+        get_telemetry().observe("sqlgen_scheduler_wait_seconds", time.monotonic() - ticket.enqueued_at, kind=ticket.kind)
+
+    def _on_timeout(self, ticket: Ticket) -> None:
+        ticket.timed_out = True
+        with self._cond:
+            self._counters["query_timeouts"] += 1
+        ticket.cancel()
+
+    def _execute(self, ticket: Ticket, fn, timeout: float):
+        token = _current_ticket.set(ticket)
+        timer = self._watchdog.schedule(timeout, lambda: self._on_timeout(ticket)) if timeout and timeout > 0 else None
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            if ticket.timed_out:
+                raise QueryTimeout(f"Query cancelled after exceeding its {timeout:g}s timeout") from e
+            if ticket.cancelled:
+                raise QueryCancelled("Query cancelled") from e
+            with self._cond:
+                self._counters["failed"] += 1
+            raise
+        finally:
+            if timer is not None:
+                self._watchdog.cancel(timer)
+            _current_ticket.reset(token)
+            get_telemetry().observe("sqlgen_scheduler_run_seconds", time.monotonic() - start, kind=ticket.kind)
+            with self._cond:
+                ticket.state = "done"
+                self._running.discard(ticket)
+                self._dispatch()
+        if ticket.timed_out:
+            raise QueryTimeout(f"Query cancelled after exceeding its {timeout:g}s timeout")
+        return result
+
+    # Run fn() once a slot is free; `key` de-duplicates identical statements in flight (results are shared)
+    def run(self, fn, kind: str = "query", user: str = None, key: str = None, timeout: float = None):
+        if not self.settings["enabled"]:
+            return fn()
+        user = user or current_query_user()
+        if timeout is None:
+            # catalog crawls, DESCRIBE DETAIL checks and DDL can be slow on a cold warehouse: only probes get the short limit
+            timeout = self.settings.get(f"{kind}_timeout", self.settings["query_timeout"])
+        leader = None
+        if key is not None:
+            with self._cond:
+                leader = self._inflight.get(key)
+                if leader is None:
+                    future = self._inflight[key] = Future()
+                else:
+                    self._counters["deduplicated"] += 1
+            if leader is not None:
+                result = leader.result()
+                # DataFrames are shared read-only, as in the result cache
+                return result.copy(deep=False) if hasattr(result, "copy") else result
+        ticket = Ticket(user, kind)
+        try:
+            self._admit(ticket)
+            result = self._execute(ticket, fn, timeout)
+        except BaseException as e:
+            if key is not None:
+                future.set_exception(e if isinstance(e, Exception) else QueryCancelled("Query abandoned"))
+            raise
+        finally:
+            if key is not None:
+                with self._cond:
+                    self._inflight.pop(key, None)
+        if key is not None:
+            future.set_result(result)
+        return result
+
+    # Cancel queued and running statements of one user (all users when None); returns how many were cancelled
+    def cancel(self, user: str = None) -> int:
+        with self._cond:
+            queued = [ticket for users in self._queues.values() for jobs in users.values() for ticket in jobs
+                      if user is None or ticket.user == user]
+            for ticket in queued:
+                self._remove(ticket)
+                ticket.state = "cancelled"
+            running = [ticket for ticket in self._running if user is None or ticket.user == user]
+            for ticket in running:
+                ticket.cancelled = True
+            self._counters["cancelled"] += len(queued) + len(running)
+            self._cond.notify_all()
+        for ticket in running:
+            ticket.cancel()
+        return len(queued) + len(running)
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued_by_kind = {kind: 0 for kind in PRIORITIES}
+            for users in self._queues.values():
+                for jobs in users.values():
+                    for ticket in jobs:
+                        queued_by_kind[ticket.kind] = queued_by_kind.get(ticket.kind, 0) + 1
+            return {**self._counters, "running": len(self._running), "queued": self._queued(),
+                    "max_concurrent": self.settings["max_concurrent"], "inflight_keys": len(self._inflight),
+                    **{f"queued_{kind}": count for kind, count in queued_by_kind.items()}}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+# Process-wide scheduler shared by every Streamlit session
+def get_scheduler() -> QueryScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                scheduler = QueryScheduler()
+                get_telemetry().register_gauges("scheduler", scheduler.stats)
+                _scheduler = scheduler
+    return _scheduler
+
+
+# Replace the process-wide scheduler (None = rebuild from the environment on next use)
+def set_scheduler(scheduler: QueryScheduler = None) -> None:
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
+        if scheduler is not None:
+            get_telemetry().register_gauges("scheduler", scheduler.stats)
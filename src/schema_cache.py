@@ -0,0 +1,144 @@
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from src.config import cache_dir, env_float, env_int
+
+
+class SchemaSummaryCache:
+    """Per-table schema summaries persisted in SQLite, invalidated by table version, TTL and size."""
+
+    def __init__(self, path: str = None, ttl_seconds: float = None, max_bytes: int = None):
+        self.path = path or os.path.join(cache_dir(), "schema_summaries.sqlite")
+        self.ttl_seconds = env_float("SQLGEN_SCHEMA_CACHE_TTL", 7 * 24 * 3600) if ttl_seconds is None else ttl_seconds
+        self.max_bytes = env_int("SQLGEN_SCHEMA_CACHE_MAX_BYTES", 50 * 1024 * 1024) if max_bytes is None else max_bytes
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS table_summaries (
+                    catalog TEXT, schema TEXT, table_name TEXT,
+                    version TEXT, summary TEXT,
+                    created_at REAL, accessed_at REAL, size_bytes INTEGER,
+                    PRIMARY KEY (catalog, schema, table_name)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[key] += amount
+
+    # Cached summary, or None when missing, expired or built from another table version
+    def get(self, catalog: str, schema: str, table: str, version=None):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT version, summary, created_at FROM table_summaries WHERE catalog=? AND schema=? AND table_name=?",
+                (catalog, schema, table),
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            cached_version, summary, created_at = row
+            if now - created_at > self.ttl_seconds or (version is not None and cached_version != str(version)):
+                conn.execute(
+                    "DELETE FROM table_summaries WHERE catalog=? AND schema=? AND table_name=?",
+                    (catalog, schema, table),
+                )
+                self._count("stale")
+                self._count("misses")
+                return None
+            conn.execute(
+                "UPDATE table_summaries SET accessed_at=? WHERE catalog=? AND schema=? AND table_name=?",
+                (now, catalog, schema, table),
+            )
+        self._count("hits")
+        return summary
+
+    def put(self, catalog: str, schema: str, table: str, summary: str, version=None) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO table_summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (catalog, schema, table, None if version is None else str(version), summary, now, now, len(summary.encode())),
+            )
+            self._evict(conn)
+
+    # Drop expired rows, then least recently used rows until the cache fits in max_bytes
+    def _evict(self, conn) -> None:
+        expired = conn.execute("DELETE FROM table_summaries WHERE created_at < ?", (time.time() - self.ttl_seconds,)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM table_summaries").fetchone()[0]
+        evicted = 0
+        if total > self.max_bytes:
+            rows = conn.execute("SELECT catalog, schema, table_name, size_bytes FROM table_summaries ORDER BY accessed_at").fetchall()
+            for catalog, schema, table, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute(
+                    "DELETE FROM table_summaries WHERE catalog=? AND schema=? AND table_name=?",
+                    (catalog, schema, table),
+                )
+                total -= size
+                evicted += 1
+        self._count("evictions", expired + evicted)
+
+    def invalidate(self, catalog: str = None, schema: str = None, table: str = None) -> None:
+        clauses, params = [], []
+        for column, value in (("catalog", catalog), ("schema", schema), ("table_name", table)):
+            if value is not None:
+                clauses.append(f"{column}=?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM table_summaries{where}", params)
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM table_summaries").fetchone()
+        with self._lock:
+            return {**self._counters, "entries": entries, "bytes": size}
+
+
+# Last-modified marker per table: one information_schema query, DESCRIBE DETAIL for tables it does not cover
+# The DESCRIBE DETAIL fallbacks run on executor when one is given (the caller's bounded pool), one at a time otherwise
+def fetch_table_versions(query_fn, catalog: str, schema: str, tables, executor=None) -> dict:
+    versions = {}
+    quote = lambda value: "'" + value.replace("'", "''") + "'"
+    table_list = ", ".join(quote(table) for table in tables)
+    try:
+        df = query_fn(f"""
+        SELECT table_name, last_altered FROM system.information_schema.tables
+        WHERE table_catalog = {quote(catalog)} AND table_schema = {quote(schema)} AND table_name IN ({table_list})
+        """)
+        versions.update({name: str(altered) for name, altered in zip(df["table_name"], df["last_altered"])})
+    except Exception:
+        pass
+
+    def describe(table):
+        try:
+            detail = query_fn(f"DESCRIBE DETAIL `{catalog}`.{schema}.{table}")
+            return str(detail["lastModified"][0])
+        except Exception:
+            # Unknown version: the entry is only refreshed by TTL
+            return None
+
+    uncovered = [table for table in tables if table not in versions]
+    if executor is None:
+        versions.update({table: describe(table) for table in uncovered})
+    else:
+        # each task runs in a copy of this context so it stays under the session user and the caller's span
+        futures = [executor.submit(contextvars.copy_context().run, describe, table) for table in uncovered]
+        versions.update(zip(uncovered, [future.result() for future in futures]))
+    return versions
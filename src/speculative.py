@@ -0,0 +1,110 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.config import env_bool, env_int, env_list
+from src.correction import correct_sql, correction_settings, strip_statement, validate_sql
+from src.telemetry import increment, span
+
+# Later validation stages mean the candidate got further, so it is the better starting point for repairs
+STAGE_ORDER = {"generate": 0, "parse": 1, "probe": 2, "execute": 3}
+
+
+# Speculative generation settings: on/off, candidates raced at once, candidate strategies and the token cost cap
+# A strategy is "<prompt variant>@<temperature>", e.g. "base@0.7"
+def speculative_settings() -> dict:
+    return {
+        "enabled": env_bool("SQLGEN_SPECULATIVE", False),
+        "fanout": env_int("SQLGEN_SPECULATIVE_FANOUT", 3),
+        "strategies": env_list("SQLGEN_SPECULATIVE_STRATEGIES", ["base@0", "base@0.7", "stepwise@0.2"]),
+        "token_budget": env_int("SQLGEN_SPECULATIVE_TOKEN_BUDGET", 20000),
+    }
+
+
+def parse_strategy(strategy: str):
+    variant, _, temperature = strategy.partition("@")
+    return variant.strip(), float(temperature or 0)
+
+
+# Strategies to launch: at most `fanout`, and no more than the estimated prompt tokens fit in `token_budget`
+# The first strategy always runs, so the cap never leaves a question without a candidate
+def plan_candidates(strategies: list, fanout: int, token_budget: int = 0, cost_fn=None):
+    launched, tokens = [], 0
+    for strategy in strategies[:max(fanout, 1)]:
+        cost = cost_fn(strategy) if cost_fn else 0
+        if launched and token_budget and tokens + cost > token_budget:
+            break
+        launched.append(strategy)
+        tokens += cost
+    return launched, tokens
+
+
+# Generate candidates in parallel and validate each one as it arrives; the first valid candidate wins
+# Queued candidates are cancelled; ones already waiting on the LLM skip validation once a winner exists
+def race_candidates(strategies: list, generate_fn, query_fn, probe="explain", execute=False, dialect="databricks") -> dict:
+    decided = threading.Event()
+
+    def attempt(strategy):
+        start = time.perf_counter()
+        try:
+            sql = strip_statement(generate_fn(strategy))
+        except Exception as e:
+            return {"strategy": strategy, "sql": None, "failed_stage": "generate", "error": str(e),
+                    "stages": {}, "seconds": time.perf_counter() - start}
+        if decided.is_set():
+            return None
+        failed_stage, error, stages = validate_sql(query_fn, sql, probe, execute, dialect)
+        return {"strategy": strategy, "sql": sql, "failed_stage": failed_stage, "error": error, "stages": stages,
+                "seconds": time.perf_counter() - start}
+
+    candidates, winner = [], None
+    pool = ThreadPoolExecutor(max_workers=len(strategies), thread_name_prefix="sqlgen-speculative")
+    try:
+        # one context copy per task keeps span nesting and the LLM cache bypass in the workers
+        futures = [pool.submit(contextvars.copy_context().run, attempt, strategy) for strategy in strategies]
+        for future in as_completed(futures):
+            candidate = future.result()
+            candidates.append(candidate)
+            if candidate["failed_stage"] is None:
+                winner = candidate
+                break
+    finally:
+        decided.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return {"winner": winner, "candidates": candidates}
+
+
+def _record_outcomes(launched: list, candidates: list, winner) -> None:
+    finished = {candidate["strategy"] for candidate in candidates}
+    for candidate in candidates:
+        outcome = "won" if candidate is winner else ("error" if candidate["failed_stage"] == "generate" else "invalid")
+        increment("sqlgen_speculative_candidates_total", strategy=candidate["strategy"], outcome=outcome)
+    for strategy in launched:
+        if strategy not in finished:
+            increment("sqlgen_speculative_candidates_total", strategy=strategy, outcome="cancelled")
+
+
+# Race the candidates, then fall back to the repair loop on the most promising failure when none is valid
+# Returns correct_sql's structure plus the winning strategy, every finished candidate and the launch plan
+def speculative_correct_sql(question, table_schema, generate_fn, query_fn, repair_fn, extract_fn=None, cost_fn=None, **overrides) -> dict:
+    settings = {**correction_settings(), **speculative_settings(), **overrides}
+    start = time.monotonic()
+    launched, estimated_tokens = plan_candidates(settings["strategies"], settings["fanout"], settings["token_budget"], cost_fn)
+    with span("sql.speculative", launched=len(launched), estimated_tokens=estimated_tokens) as current:
+        race = race_candidates(launched, generate_fn, query_fn, settings["probe"], settings["execute"], settings["dialect"])
+        winner, candidates = race["winner"], race["candidates"]
+        _record_outcomes(launched, candidates, winner)
+        current.set(winner=winner["strategy"] if winner else None, finished=len(candidates))
+        plan = {"candidates": candidates, "launched": launched, "estimated_tokens": estimated_tokens}
+        if winner:
+            attempt = {"attempt": 1, "sql": winner["sql"], "failed_stage": None, "error": None, "stages": winner["stages"]}
+            return {"status": "Correct", "sql": winner["sql"], "attempts": [attempt], "repairs": 0,
+                    "elapsed_seconds": time.monotonic() - start, "strategy": winner["strategy"], **plan}
+        usable = [candidate for candidate in candidates if candidate["sql"] is not None]
+        if not usable:
+            raise RuntimeError(f"Every SQL candidate failed to generate: {candidates[-1]['error']}")
+        best = max(usable, key=lambda candidate: STAGE_ORDER.get(candidate["failed_stage"], 0))
+        remaining = max(settings["deadline_seconds"] - (time.monotonic() - start), 0.0)
+        correction = correct_sql(question, best["sql"], table_schema, query_fn, repair_fn, extract_fn,
+                                 **{**overrides, "deadline_seconds": remaining})
+        return {**correction, "elapsed_seconds": time.monotonic() - start, "strategy": f"{best['strategy']}+repair", **plan}
@@ -0,0 +1,321 @@
+import atexit
+import functools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.config import cache_dir, env_bool, env_float, env_int, env_str
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span = ContextVar("sqlgen_current_span", default=None)
+
+
+# Telemetry settings: spans on/off, JSONL sink (written in batches from a background thread), Prometheus endpoint port (0 = off) and in-memory span history
+def telemetry_settings() -> dict:
+    return {
+        "enabled": env_bool("SQLGEN_TELEMETRY", True),
+        "jsonl_path": env_str("SQLGEN_TELEMETRY_JSONL", os.path.join(cache_dir(), "telemetry.jsonl")),
+        "jsonl_max_bytes": env_int("SQLGEN_TELEMETRY_JSONL_MAX_BYTES", 50 * 1024 * 1024),
+        "jsonl_flush_interval": env_float("SQLGEN_TELEMETRY_FLUSH_INTERVAL", 2.0),
+        "jsonl_max_buffered": env_int("SQLGEN_TELEMETRY_MAX_BUFFERED", 10000),
+        "metrics_port": env_int("SQLGEN_METRICS_PORT", 0),
+        "recent_spans": env_int("SQLGEN_TELEMETRY_RECENT_SPANS", 500),
+    }
+
+
+class Span:
+    """One timed operation; attributes (rows, tokens, cache hits, ...) are added while it runs."""
+
+    def __init__(self, name: str, parent=None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def fail(self, error) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def finish(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id, "name": self.name,
+            "start": self.started_at, "duration_ms": (self.duration or 0.0) * 1000, "status": self.status,
+            "error": self.error, "attributes": self.attributes,
+        }
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+class Telemetry:
+    """Span recorder plus counters/histograms, exported as JSONL lines and Prometheus text."""
+
+    def __init__(self, settings: dict = None):
+        self.settings = {**telemetry_settings(), **(settings or {})}
+        self._counters = {}  # (metric, labels) -> value
+        self._histograms = {}  # (metric, labels) -> [bucket counts..., sum, count]
+        self._gauges = {}  # prefix -> fn() returning {name: number}
+        self._recent = deque(maxlen=self.settings["recent_spans"])
+        self._lock = threading.Lock()
+        self._sink_lock = threading.Lock()
+        self._buffer = deque()  # span records waiting for the JSONL writer thread
+        self._buffer_cond = threading.Condition()
+        self._writer = None
+        self._server = None
+
+    def increment(self, metric: str, amount: float = 1, **labels) -> None:
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, metric: str, value: float, **labels) -> None:
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            buckets = self._histograms.setdefault(key, [0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            buckets[-2] += value
+            buckets[-1] += 1
+
+    # Numbers returned by fn() are exported as gauges named sqlgen_<prefix>_<key> (non-numeric values are skipped)
+    def register_gauges(self, prefix: str, fn) -> None:
+        with self._lock:
+            self._gauges[prefix] = fn
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if not self.settings["enabled"]:
+            yield Span(name, **attributes)
+            return
+        span = Span(name, _current_span.get(), **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            # Streamlit's rerun/stop exceptions are control flow, not failures
+            if isinstance(e, Exception) and type(e).__name__ not in ("RerunException", "StopException"):
+                span.fail(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            self._record(span)
+
+    # Record an operation that was timed outside a `with span(...)` block (e.g. a whole Streamlit rerun)
+    def record(self, name: str, seconds: float, **attributes) -> None:
+        if not self.settings["enabled"]:
+            return
+        span = Span(name, _current_span.get(), **attributes)
+        span.duration = seconds
+        span.started_at -= seconds
+        self._record(span)
+
+    def _record(self, span: Span) -> None:
+        self.observe("sqlgen_span_duration_seconds", span.duration, span=span.name)
+        self.increment("sqlgen_spans_total", span=span.name, status=span.status)
+        record = span.to_dict()
+        with self._lock:
+            self._recent.append(record)
+        self._write(record)
+
+    # Queue a span record for the JSONL sink; the request thread never touches the disk
+    def _write(self, record: dict) -> None:
+        path = self.settings["jsonl_path"]
+        if not path or path.lower() == "none":
+            return
+        with self._buffer_cond:
+            if len(self._buffer) >= self.settings["jsonl_max_buffered"]:
+                # the disk cannot keep up: drop the span rather than grow without bound
+                dropped = True
+            else:
+                dropped = False
+                self._buffer.append(record)
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run_writer, name="sqlgen-telemetry-writer", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)
+        if dropped:
+            self.increment("sqlgen_telemetry_dropped_spans_total")
+
+    def _run_writer(self) -> None:
+        while True:
+            with self._buffer_cond:
+                self._buffer_cond.wait(self.settings["jsonl_flush_interval"])
+            self.flush()
+
+    # Append every buffered span record to the JSONL sink in one write
+    def flush(self) -> None:
+        with self._buffer_cond:
+            records = list(self._buffer)
+            self._buffer.clear()
+        if not records:
+            return
+        path = self.settings["jsonl_path"]
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+        with self._sink_lock:
+            try:
+                if os.path.exists(path) and os.path.getsize(path) > self.settings["jsonl_max_bytes"]:
+                    os.replace(path, f"{path}.1")
+                with open(path, "a") as f:
+                    f.write(lines)
+            except OSError:
+                # telemetry must never break the app
+                pass
+
+    def recent_spans(self, limit: int = None) -> list:
+        with self._lock:
+            spans = list(self._recent)
+        return spans[-limit:] if limit else spans
+
+    # Count, p50, p95, total seconds and errors per span name over the recent spans
+    def span_summary(self) -> list:
+        by_name = {}
+        for record in self.recent_spans():
+            by_name.setdefault(record["name"], []).append(record)
+        rows = []
+        for name, records in sorted(by_name.items()):
+            durations = sorted(r["duration_ms"] for r in records)
+            rows.append({
+                "span": name,
+                "count": len(records),
+                "p50_ms": durations[(len(durations) - 1) // 2],
+                "p95_ms": durations[int((len(durations) - 1) * 0.95)],
+                "total_ms": sum(durations),
+                "errors": sum(r["status"] == "error" for r in records),
+            })
+        return rows
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+            gauges = dict(self._gauges)
+        lines, typed = [], set()
+        for (metric, labels), value in sorted(counters.items()):
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_label_text(labels)} {value}")
+        for (metric, labels), buckets in sorted(histograms.items()):
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            for bound, count in zip(DURATION_BUCKETS, buckets):
+                lines.append(f"{metric}_bucket{_label_text(labels + (('le', bound),))} {count}")
+            lines.append(f"{metric}_bucket{_label_text(labels + (('le', '+Inf'),))} {buckets[-1]}")
+            lines.append(f"{metric}_sum{_label_text(labels)} {buckets[-2]}")
+            lines.append(f"{metric}_count{_label_text(labels)} {buckets[-1]}")
+        for prefix, fn in sorted(gauges.items()):
+            try:
+                values = fn() or {}
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = _metric_name(f"sqlgen_{prefix}_{key}")
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Serve prometheus_text() at http://<host>:<port>/metrics from a daemon thread
+    def start_metrics_server(self, port: int, host: str = "0.0.0.0") -> None:
+        if self._server is not None or not port:
+            return
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            # another app process on this host already serves the port
+            return
+        threading.Thread(target=self._server.serve_forever, name="sqlgen-metrics", daemon=True).start()
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+# Process-wide telemetry; starts the metrics endpoint when SQLGEN_METRICS_PORT is set
+def get_telemetry() -> Telemetry:
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                telemetry = Telemetry()
+                telemetry.start_metrics_server(telemetry.settings["metrics_port"])
+                _telemetry = telemetry
+    return _telemetry
+
+
+def span(name: str, **attributes):
+    return get_telemetry().span(name, **attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def increment(metric: str, amount: float = 1, **labels) -> None:
+    get_telemetry().increment(metric, amount, **labels)
+
+
+# Decorator: run the function inside a span named `name` (defaults to module.function)
+def traced(name: str = None):
+    def decorator(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        # keep st.cache_data's .clear() reachable through the wrapper
+        if hasattr(fn, "clear"):
+            wrapper.clear = fn.clear
+        return wrapper
+
+    return decorator
@@ -1,15 +1,30 @@
-from sqlalchemy.engine import create_engine
-import os
 import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
-from langchain.prompts import PromptTemplate
-from langchain.chains.llm import LLMChain
-from langchain_openai import ChatOpenAI
-from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from dotenv import load_dotenv
 load_dotenv()
 import hashlib
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.config import env_int
+from src.engine import get_engine, engine_connection, engine_stats
+from src.crawler import build_catalog_index, crawl_table_metadata
+from src.schema_cache import SchemaSummaryCache, fetch_table_versions
+from src.profiling import profile_categorical
+from src.llm_cache import cache_bypassed, get_llm_cache, llm_cache_key
+from src.telemetry import get_telemetry, increment, span, traced
+from src.correction import correct_sql, correction_settings, strip_statement, validate_sql
+from src.speculative import parse_strategy, speculative_correct_sql, speculative_settings
+from src.results import fetch_result, result_settings
+from src.result_cache import get_result_cache, result_cache_key
+from src.retrieval import count_tokens, prune_schema
+from src.erd import generate_erd
+from src.followup import FollowupEngine, execute_statement
+from src.scheduler import classify_statement, get_scheduler, set_query_user
+from src.history import get_history_store, get_history_writer
 
 
 def get_fav_key(question: str) -> str:
@@ -17,19 +32,52 @@ def get_fav_key(question: str) -> str:
     h = hashlib.md5(question.encode()).hexdigest()
     return f"fav_ind__{h}"
 
-# Establish connection to Databricks
+# Shared, pooled connection to Databricks (one engine per process, see src/engine.py)
 def get_databricks_engine():
-    conn_str = (
-        f"databricks://token:{os.getenv('DATABRICKS_ACCESS_TOKEN')}"
-        f"@{os.getenv('DATABRICKS_SERVER_HOSTNAME')}?http_path={os.getenv('DATABRICKS_HTTP_PATH')}"
-    )
-    return create_engine(conn_str)
-
-# Extract specific code blocks (SQL/Mermaid) from LLM response
+    return get_engine()
+
+# Warehouse query function; swap in a local stand-in (see benchmarks/warehouse.py) to run offline
+_warehouse_query = None
+
+def set_warehouse_query(query_fn=None):
+    global _warehouse_query
+    _warehouse_query = query_fn
+
+# Run a statement on a pooled connection and return the result as a DataFrame
+# Goes through the query scheduler (src/scheduler.py): concurrency cap, per-user fairness, timeouts
+# timeout (seconds) overrides the scheduler's run timeout for this statement
+def read_sql(query: str, timeout: float = None) -> pd.DataFrame:
+    statement = query.split(None, 1)[0].upper() if query.strip() else ""
+    kind = classify_statement(query)
+
+    def run():
+        if _warehouse_query is not None:
+            return _warehouse_query(query)
+        with engine_connection() as conn:
+            return pd.read_sql(query, conn)
+
+    with span("warehouse.query", statement=statement, kind=kind) as current:
+        df = get_scheduler().run(run, kind=kind, key=f"read:{' '.join(query.split())}", timeout=timeout)
+        current.set(rows=len(df))
+        increment("sqlgen_warehouse_rows_total", len(df), statement=statement)
+        return df
+
+# fetch_result through the query scheduler; identical fetches in flight are run once
+def _scheduled_fetch(sql, limit=None, max_bytes=None, offset=0):
+    key = f"fetch:{limit}:{offset}:{max_bytes}:{' '.join(sql.split())}"
+    return get_scheduler().run(lambda: fetch_result(sql, limit=limit, max_bytes=max_bytes, offset=offset), kind="query", key=key)
+
+# DDL (follow-up scratch tables) through the query scheduler; never de-duplicated
+def _scheduled_execute(sql):
+    return get_scheduler().run(lambda: execute_statement(sql), kind="query")
+
+# Extract specific code blocks (SQL/Mermaid) from LLM response (responses without a fence are returned as-is)
 def extract_code_block(response: str, code_type: str) -> str:
+    if f"```{code_type}" not in response:
+        return response.strip().strip("`").strip()
     start = response.find(f"```{code_type}") + len(f"```{code_type}")
     end = response.find("```", start)
-    return response[start:end].strip()
+    return response[start:end if end != -1 else None].strip()
 
 # Render Mermaid diagram in Streamlit
 def render_mermaid_diagram(code: str) -> None:
@@ -45,135 +93,247 @@ def render_mermaid_diagram(code: str) -> None:
     """, height=800)
     
 
+# Chat model factory; swap in a fake model (e.g. langchain's FakeListChatModel) to run offline
+# langchain is imported on the first LLM call rather than at app start-up (it is the slowest import)
+_chat_model_factory = None
+
+def set_chat_model_factory(factory=None):
+    global _chat_model_factory
+    _chat_model_factory = factory
+
+def get_chat_model(model: str, temperature: float):
+    if _chat_model_factory is None:
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model, temperature=temperature)
+    return _chat_model_factory(model=model, temperature=temperature)
+
+# Cached response for a prompt, unless the cache is disabled or bypassed for a regenerate
+def _cached_llm_response(key: str):
+    cache = get_llm_cache()
+    if cache is None or cache_bypassed():
+        return None
+    value = cache.get(key)
+    increment("sqlgen_cache_requests_total", cache="llm", result="miss" if value is None else "hit")
+    return value
+
+def _store_llm_response(key: str, value) -> None:
+    cache = get_llm_cache()
+    if cache is not None:
+        cache.put(key, value)
+
+# Token estimates for one LLM call, added to the token counters; returns span attributes
+def _llm_usage(model, prompt_text, completion) -> dict:
+    prompt_tokens, completion_tokens = count_tokens(prompt_text), count_tokens(str(completion))
+    increment("sqlgen_llm_tokens_total", prompt_tokens, model=model, direction="prompt")
+    increment("sqlgen_llm_tokens_total", completion_tokens, model=model, direction="completion")
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+
 # Basic LLM call returning raw text
 def run_basic_llm(template_string: str, model="gpt-4o-mini", temperature=0, **kwargs) -> str:
-    prompt_template = PromptTemplate.from_template(template_string)
-
-    ### Defining the LLM chain
-    llm_chain = LLMChain(
-        llm=ChatOpenAI(model=model,temperature=temperature),
-        prompt=prompt_template
-    )
+    with span("llm.call", model=model, structured=False) as current:
+        key = llm_cache_key(template_string, model, temperature, kwargs)
+        cached = _cached_llm_response(key)
+        current.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        from langchain.prompts import PromptTemplate
+        from langchain.chains.llm import LLMChain
+        prompt_template = PromptTemplate.from_template(template_string)
+
+        ### Defining the LLM chain
+        llm_chain = LLMChain(
+            llm=get_chat_model(model, temperature),
+            prompt=prompt_template
+        )
+
+        response =  llm_chain.invoke(kwargs)
+        output = response['text']
+        current.set(**_llm_usage(model, prompt_template.format(**kwargs), output))
+        _store_llm_response(key, output)
+        return output
 
-    response =  llm_chain.invoke(kwargs)
-    output = response['text']    
+# LLM call with structured output parser
+def run_structured_llm(template_string: str, output_parser, model="gpt-4o-mini", temperature=0, **kwargs):
+    with span("llm.call", model=model, structured=True) as current:
+        inputs = {**kwargs, "format_instructions": output_parser.get_format_instructions()}
+        key = llm_cache_key(template_string, model, temperature, inputs)
+        cached = _cached_llm_response(key)
+        current.set(cache_hit=cached is not None)
+        if cached is not None:
+            return {**inputs, "text": cached}
+
+        from langchain.prompts import PromptTemplate
+        from langchain.chains.llm import LLMChain
+        prompt_template = PromptTemplate.from_template(template_string)
+        chain = LLMChain(
+            llm=get_chat_model(model, temperature),
+            prompt=prompt_template,
+            output_parser=output_parser
+        )
+        response = chain.invoke(inputs)
+        current.set(**_llm_usage(model, prompt_template.format(**inputs), response['text']))
+        _store_llm_response(key, response['text'])
+        return response
+
+# True once `text` holds a complete ```<code_type> ... ``` block
+def code_block_complete(text: str, code_type: str = "sql") -> bool:
+    start = text.find(f"```{code_type}")
+    return start != -1 and text.find("```", start + 3 + len(code_type)) != -1
+
+# Yield the completion of `prompt` chunk by chunk; stop_when(text_so_far) ends the stream early
+# The text received is stored in the LLM cache under the same key run_basic_llm uses
+def _stream_llm(key, prompt, inputs, model, temperature, stop_when=None):
+    cached = _cached_llm_response(key)
+    if cached is not None:
+        yield cached if isinstance(cached, str) else str(cached)
+        return
+    started = time.perf_counter()
+    chunks, stopped_early = [], False
+    try:
+        for chunk in (prompt | get_chat_model(model, temperature)).stream(inputs):
+            text = chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+            chunks.append(text)
+            yield text
+            if stop_when is not None and stop_when("".join(chunks)):
+                # leaving the loop closes the HTTP stream, so the remaining tokens are never generated
+                stopped_early = True
+                break
+    except Exception as e:
+        get_telemetry().record("llm.stream", time.perf_counter() - started, model=model, error=f"{type(e).__name__}: {e}")
+        raise
+    output = "".join(chunks)
+    get_telemetry().record("llm.stream", time.perf_counter() - started, model=model, stopped_early=stopped_early,
+                           **_llm_usage(model, prompt.format(**inputs), output))
     return output
 
-# LLM call with structured output parser
-def run_structured_llm(template_string: str, output_parser: StructuredOutputParser, model="gpt-4o-mini", temperature=0, **kwargs):
-    prompt_template = PromptTemplate.from_template(template_string)
-    chain = LLMChain(
-        llm=ChatOpenAI(model=model, temperature=temperature),
-        prompt=prompt_template,
-        output_parser=output_parser
-    )
-    return chain.invoke({**kwargs, "format_instructions": output_parser.get_format_instructions()})
+# Streaming run_basic_llm: yields text as it arrives; a finished stream feeds the same cache entry
+def stream_basic_llm(template_string: str, model="gpt-4o-mini", temperature=0, stop_when=None, **kwargs):
+    from langchain.prompts import PromptTemplate
+    key = llm_cache_key(template_string, model, temperature, kwargs)
+    output = yield from _stream_llm(key, PromptTemplate.from_template(template_string), kwargs, model, temperature, stop_when)
+    if output is not None:
+        _store_llm_response(key, output)
+
+# Streaming run_structured_llm: yields the raw text; once complete it is parsed and cached like run_structured_llm
+def stream_structured_llm(template_string: str, output_parser, model="gpt-4o-mini", temperature=0, **kwargs):
+    from langchain.prompts import PromptTemplate
+    inputs = {**kwargs, "format_instructions": output_parser.get_format_instructions()}
+    key = llm_cache_key(template_string, model, temperature, inputs)
+    output = yield from _stream_llm(key, PromptTemplate.from_template(template_string), inputs, model, temperature)
+    if output is not None:
+        _store_llm_response(key, output_parser.parse(output))
 
 # Fetch catalogs, schemas, tables from Databricks
+# Failed catalogs/schemas are reported in the frame's attrs["crawl_failures"]
+@traced("utils.fetch_table_metadata")
 @st.cache_data
 def fetch_table_metadata():
-    engine = get_databricks_engine()
-    catalogs_df = pd.read_sql("SHOW CATALOGS", engine)
-    catalogs = catalogs_df["catalog"].tolist()
-
-    all_tables = []
-
-    for catalog in catalogs:
-        try:
-            schemas_df = pd.read_sql(f"SHOW SCHEMAS IN {catalog}", engine)
-            schemas = schemas_df["databaseName"].tolist()
-
-            for schema in schemas:
-                try:
-                    tables_df = pd.read_sql(f"SHOW TABLES IN {catalog}.{schema}", engine)
-                    result = tables_df[["tableName"]].copy()
-                    result["catalog"] = catalog
-                    result["schema"] = schema
-                    all_tables.append(result)
-                except Exception as e:
-                    print(f"❌ Failed to get tables from {catalog}.{schema}: {e}")
-        except Exception as e:
-            print(f"❌ Failed to get schemas from {catalog}: {e}")
-
-    return pd.concat(all_tables, ignore_index=True)[["catalog", "schema", "tableName"]]
-
-# Extract schema structure + sample data + categorical info
-@st.cache_data
+    tables, failures = crawl_table_metadata(read_sql)
+    tables.attrs["crawl_failures"] = failures
+    return tables
+
+# Catalog -> schema -> tables index and crawl failures, built once per metadata fetch and shared by every rerun
+# Served by reference (no per-rerun copy of the metadata frame); the index holds tuples so it cannot be mutated
+@traced("utils.fetch_catalog_index")
+@st.cache_resource(show_spinner=False)
+def fetch_catalog_index():
+    metadata = fetch_table_metadata()
+    return {"index": build_catalog_index(metadata), "crawl_failures": list(metadata.attrs.get("crawl_failures", []))}
+
+# Re-crawl the catalog on the next rerun (metadata and the index derived from it)
+def refresh_table_metadata() -> None:
+    fetch_table_metadata.clear()
+    fetch_catalog_index.clear()
+
+# Extract schema structure + sample data + categorical info for one table
+# Returns (summary, complete); incomplete summaries (profiling over its time budget) are not cached
+@traced("utils.summarize_single_table")
+def summarize_single_table(catalog, schema, table):
+    table_ref = f"`{catalog}`.{schema}.{table}"
+    stmt = read_sql(f"SHOW CREATE TABLE {table_ref}")['createtab_stmt'][0].split("USING")[0]
+    string_cols = read_sql(f"DESCRIBE TABLE {table_ref}")
+    strings = string_cols[string_cols['data_type'] == 'string']['col_name'].tolist()
+    cat_info, complete = profile_categorical(read_sql, table_ref, strings)
+    sample = read_sql(f"SELECT * FROM {table_ref} LIMIT 2").to_string(index=False)
+    return f"{stmt}\n{sample}\n\nCategorical Fields:\n{cat_info}\n", complete
+
+# Process-wide handle on the on-disk per-table summary cache
+@st.cache_resource
+def get_schema_summary_cache():
+    return SchemaSummaryCache()
+
+# Per-table schema summaries {table: summary}; only new or changed tables are recomputed, in parallel
+@traced("utils.summarize_table_pieces")
+@st.cache_data(ttl=300, show_spinner=False)
+def summarize_table_pieces(catalog, schema, tables):
+    cache = get_schema_summary_cache()
+    with ThreadPoolExecutor(max_workers=env_int("SQLGEN_SUMMARY_MAX_WORKERS", 4)) as executor:
+        versions = fetch_table_versions(read_sql, catalog, schema, tables, executor=executor)
+        summaries = {table: cache.get(catalog, schema, table, versions.get(table)) for table in tables}
+        missing = [table for table, summary in summaries.items() if summary is None]
+        # each task runs in a copy of this context so its spans nest under this one
+        futures = [executor.submit(contextvars.copy_context().run, summarize_single_table, catalog, schema, table) for table in missing]
+        for table, (summary, complete) in zip(missing, (future.result() for future in futures)):
+            summaries[table] = summary
+            if complete:
+                cache.put(catalog, schema, table, summary, versions.get(table))
+    return {table: summaries[table] for table in tables}
+
+# Combined schema summary assembled from the cached per-table pieces
 def summarize_table_schema(catalog, schema, tables):
-    engine = get_databricks_engine()
-    full_schema = ""
-    for table in tables:
-        stmt = pd.read_sql(f"SHOW CREATE TABLE `{catalog}`.{schema}.{table}", engine)['createtab_stmt'][0].split("USING")[0]
-        string_cols = pd.read_sql(f"DESCRIBE TABLE `{catalog}`.{schema}.{table}", engine)
-        strings = string_cols[string_cols['data_type'] == 'string']['col_name'].tolist()
-        if strings:
-            unions = [
-                f"SELECT '{col}' AS column_name, COUNT(DISTINCT {col}) AS cnt, ARRAY_AGG(DISTINCT {col}) AS values FROM `{catalog}`.{schema}.{table}"
-                for col in strings
-            ]
-            df_cat = pd.read_sql(" UNION ALL ".join(unions), engine)
-            df_cat = df_cat[df_cat['cnt'] <= 20].drop(columns='cnt')
-            cat_info = df_cat.to_string(index=False) if not df_cat.empty else "No Categorical Fields"
-        else:
-            cat_info = "No Categorical Fields"
-        sample = pd.read_sql(f"SELECT * FROM `{catalog}`.{schema}.{table} LIMIT 2", engine).to_string(index=False)
-        full_schema += f"{stmt}\n{sample}\n\nCategorical Fields:\n{cat_info}\n"
-    return full_schema
-
-# Create ERD diagram using LLM
-@st.cache_data
-@st.experimental_fragment
-def generate_erd_mermaid(catalog, schema, tables):
-    engine = get_databricks_engine()
-    table_meta = {}
-    for table in tables:
-        query = f"DESCRIBE TABLE `{catalog}`.{schema}.{table}"
-        df = pd.read_sql(sql=query,con=engine)
-        cols = df['col_name'].tolist()
-        col_types = df['data_type'].tolist()
-        cols_dict = [f"{col} : {col_type}" for col,col_type in zip(cols,col_types)]
-        table_meta[table] = cols_dict
-    prompt = """
-            You are an expert in designing Entity Relationship Diagrams (ERDs) for databases.
+    return "".join(summarize_table_pieces(catalog, schema, tables).values())
 
-            Your task is to analyze the provided table schema and generate valid Mermaid code that represents the ERD. The diagram should include:
-            - All selected tables
-            - Their columns and data types
-            - Any clear relationships between tables
+# Schema context relevant to one question, within SQLGEN_SCHEMA_TOKEN_BUDGET; returns (schema_text, report)
+@traced("utils.relevant_table_schema")
+def relevant_table_schema(question, schema_pieces):
+    return prune_schema(question, schema_pieces)
 
-            The schema is provided below (delimited by ##) in dictionary format:
-            - Keys represent table names
-            - Values are lists of columns with their data types
+# ER diagrams per (catalog, schema, tables), shared by every session; kept here rather than in st.cache_data
+# so "Regenerate" can drop a single selection (st.cache_data's .clear() empties the whole cache)
+_erd_diagrams = OrderedDict()
+_erd_lock = threading.Lock()
 
-            ##
-            {table_schema}
-            ##
-
-            Carefully validate the input and ensure the Mermaid code is accurate, well-structured, and easy to understand.
-
-            Return only the final Mermaid code for the ERD.
-            """
-
-    return run_basic_llm(template_string=prompt,model="gpt-4o-mini",temperature=0,table_schema=table_meta)
-
-# Generate initial SQL from question
-@st.cache_data
-@st.experimental_fragment
-def generate_initial_sql(question, table_schema):
-    prompt = """
+# Create ERD diagram from table metadata (the LLM is only asked about ambiguous relationships, when enabled)
+@traced("utils.generate_erd_mermaid")
+def generate_erd_mermaid(catalog, schema, tables):
+    key = (catalog, schema, tuple(tables))
+    with _erd_lock:
+        if key in _erd_diagrams:
+            _erd_diagrams.move_to_end(key)
+            return _erd_diagrams[key]
+    llm_fn = lambda prompt: run_basic_llm(template_string="{prompt}", model="gpt-4o-mini", temperature=0, prompt=prompt)
+    diagram = generate_erd(read_sql, catalog, schema, tables, llm_fn=llm_fn)
+    with _erd_lock:
+        _erd_diagrams[key] = diagram
+        while len(_erd_diagrams) > max(env_int("SQLGEN_ERD_CACHE_SIZE", 256), 1):
+            _erd_diagrams.popitem(last=False)
+    return diagram
+
+# Forget the ER diagram of one selection, so the next call builds it again (other selections keep theirs)
+def clear_erd_diagram(catalog, schema, tables) -> None:
+    with _erd_lock:
+        _erd_diagrams.pop((catalog, schema, tuple(tables)), None)
+
+INITIAL_SQL_PROMPT = """
     Create a valid SQL query in Databricks SQL syntax to answer the user's question.
     Use full schema references, appropriate data types, and clean joins.
     SCHEMA: ## {table_schema} ##
     QUESTION: ## {question} ##
     Only return the SQL code.
     """
-    return run_basic_llm(prompt, question=question, table_schema=table_schema)
 
-# Extend SQL with additional logic using previous result
-@st.cache_data
-@st.experimental_fragment
-def enhance_sql_with_cte(question, table_schema, sql_code):
-    prompt = """
+# Generate initial SQL from question
+@traced("utils.generate_initial_sql")
+@st.cache_data(show_spinner=False)
+def generate_initial_sql(question, table_schema):
+    return run_basic_llm(INITIAL_SQL_PROMPT, question=question, table_schema=table_schema)
+
+# Stream the initial SQL as it is generated, ending at the closing code fence
+def stream_initial_sql(question, table_schema):
+    return stream_basic_llm(INITIAL_SQL_PROMPT, stop_when=code_block_complete, question=question, table_schema=table_schema)
+
+CTE_SQL_PROMPT = """
     Given this SQL (named 'MASTER'), wrap it in a WITH clause.
     Then generate a new SQL query that uses it to answer a follow-up question.
     SQL_CODE: ## {sql_code} ##
@@ -181,27 +341,91 @@ def enhance_sql_with_cte(question, table_schema, sql_code):
     QUESTION: ## {question} ##
     Return only the final SQL.
     """
-    return run_basic_llm(prompt, sql_code=sql_code, question=question, table_schema=table_schema)
 
-# Run SQL and return data
+# Extend SQL with additional logic using previous result
+@traced("utils.enhance_sql_with_cte")
 @st.cache_data
-@st.experimental_fragment
+def enhance_sql_with_cte(question, table_schema, sql_code):
+    return run_basic_llm(CTE_SQL_PROMPT, sql_code=sql_code, question=question, table_schema=table_schema)
+
+# Stream the follow-up SQL as it is generated, ending at the closing code fence
+def stream_enhanced_sql(question, table_schema, sql_code):
+    return stream_basic_llm(CTE_SQL_PROMPT, stop_when=code_block_complete, sql_code=sql_code, question=question, table_schema=table_schema)
+
+# Run fetch_fn inside a warehouse.fetch span with row and byte counts
+def _fetch_with_span(fetch_fn):
+    with span("warehouse.fetch") as current:
+        df = fetch_fn()
+        current.set(rows=len(df), bytes=df.attrs.get("bytes"), truncated=df.attrs.get("truncated"))
+        increment("sqlgen_warehouse_rows_total", len(df), statement="FETCH")
+        return df
+
+# Result cache lookup; misses are fetched with _fetch_with_span and stored
+def _cached_result(key, fetch_fn):
+    cache = get_result_cache()
+    df = cache.get(key)
+    increment("sqlgen_cache_requests_total", cache="result", result="miss" if df is None else "hit")
+    if df is None:
+        df = _fetch_with_span(fetch_fn)
+        cache.put(key, df)
+    return df
+
+# Run SQL and return data (fetched in batches, capped at SQLGEN_RESULT_MAX_BYTES, shared via the result cache)
+@traced("utils.execute_sql_query")
 def execute_sql_query(query):
-    return pd.read_sql(query, get_databricks_engine())
-
-# Attempt to run SQL, return error if any
-@st.experimental_fragment
+    key = result_cache_key(query, dialect=result_settings()["dialect"])
+    return _cached_result(key, lambda: _scheduled_fetch(query))
+
+# One page of `rows` rows starting at `offset`, with LIMIT / OFFSET pushed down into the SQL; attrs["has_more"] flags further pages
+# Only the first page goes through the result cache; later pages are fetched on demand and kept by the caller
+@traced("utils.preview_sql_query")
+def preview_sql_query(query, rows=None, offset=0):
+    settings = result_settings()
+    rows = rows or settings["preview_rows"]
+    if offset:
+        return _fetch_with_span(lambda: _scheduled_fetch(query, limit=rows, offset=offset))
+    key = result_cache_key(query, variant=f"preview:{rows}", dialect=settings["dialect"])
+    return _cached_result(key, lambda: _scheduled_fetch(query, limit=rows))
+
+# Follow-up engine for one UI session: materializes each MASTER result once (see src/followup.py)
+def new_followup_engine() -> FollowupEngine:
+    return FollowupEngine(read_sql, fetch_fn=_scheduled_fetch, execute_fn=_scheduled_execute)
+
+# One page of a follow-up query, run over the materialized MASTER result when possible
+# attrs["followup"] says where it ran (local / warehouse / inline); pages after the first are not cached
+@traced("utils.preview_followup_query")
+def preview_followup_query(engine, base_sql, followup_sql, rows=None, offset=0):
+    settings = result_settings()
+    rows = rows or settings["preview_rows"]
+    if offset:
+        return _fetch_with_span(lambda: engine.run(base_sql, followup_sql, limit=rows, offset=offset))
+    key = result_cache_key(followup_sql, variant=f"followup:{rows}:{result_cache_key(base_sql, dialect=settings['dialect'])}", dialect=settings["dialect"])
+    return _cached_result(key, lambda: engine.run(base_sql, followup_sql, limit=rows))
+
+# Queue the warehouse statements of this Streamlit session under the logged-in user (fair share per user)
+def set_warehouse_user(user_name):
+    set_query_user(user_name)
+
+# Cancel a user's queued and running warehouse statements; returns how many were cancelled
+def cancel_user_queries(user_name) -> int:
+    return get_scheduler().cancel(user_name)
+
+# Running / queued statements and admission counters of the query scheduler
+def scheduler_stats() -> dict:
+    return get_scheduler().stats()
+
+# Hit / miss / eviction counters and byte usage of the result cache
+def result_cache_stats() -> dict:
+    return get_result_cache().stats()
+
+# Check SQL without running it (local parse, then EXPLAIN / LIMIT 0 on the warehouse); return error if any
+@traced("utils.check_sql_validity")
 def check_sql_validity(query):
-    try:
-        execute_sql_query(query)
-        return "Successful"
-    except Exception as e:
-        return str(e)
+    settings = correction_settings()
+    failed_stage, error, _ = validate_sql(read_sql, strip_statement(query), settings["probe"], settings["execute"], settings["dialect"])
+    return "Successful" if failed_stage is None else error
 
-# Use LLM to fix broken SQL
-@st.experimental_fragment
-def repair_faulty_sql(question, sql_code, table_schema, error_msg):
-    prompt = """
+REPAIR_SQL_PROMPT = """
     Modify the SQL query below to fix the error using the schema and error message provided.
     SCHEMA: ## {table_schema} ##
     ERROR: ## {error_msg} ##
@@ -209,17 +433,75 @@ def repair_faulty_sql(question, sql_code, table_schema, error_msg):
     QUESTION: ## {question} ##
     Return only the corrected SQL.
     """
-    return run_basic_llm(prompt, question=question, sql_code=sql_code, table_schema=table_schema, error_msg=error_msg)
 
-# Validate and self-correct SQL
+# Use LLM to fix broken SQL
+@traced("utils.repair_faulty_sql")
+def repair_faulty_sql(question, sql_code, table_schema, error_msg):
+    return run_basic_llm(REPAIR_SQL_PROMPT, question=question, sql_code=sql_code, table_schema=table_schema, error_msg=error_msg)
+
+# Stream a repaired query as it is generated, ending at the closing code fence
+def stream_repaired_sql(question, sql_code, table_schema, error_msg):
+    return stream_basic_llm(REPAIR_SQL_PROMPT, stop_when=code_block_complete, question=question, sql_code=sql_code, table_schema=table_schema, error_msg=error_msg)
+
+# Validate and self-correct SQL (single step)
 def validate_and_fix_sql(question, query, table_schema):
     status = check_sql_validity(query)
-    return ("Correct", query) if status == "Successful" else ("Incorrect", repair_faulty_sql(question, query, table_schema, status))
+    return ("Correct", query) if status == "Successful" else ("Incorrect", extract_code_block(repair_faulty_sql(question, query, table_schema, status), 'sql'))
+
+# Self-correction loop with a retry budget and deadline; returns the structured result from src/correction.py
+# repair_fn replaces repair_faulty_sql, e.g. to stream each repair into the UI
+@traced("utils.correct_sql_with_budget")
+def correct_sql_with_budget(question, query, table_schema, repair_fn=None, **overrides):
+    return correct_sql(
+        question, query, table_schema,
+        query_fn=read_sql,
+        repair_fn=repair_fn or repair_faulty_sql,
+        extract_fn=lambda response: extract_code_block(response, 'sql'),
+        **overrides
+    )
+
+STEPWISE_SQL_PROMPT = """
+    Create a valid SQL query in Databricks SQL syntax to answer the user's question.
+    First pick the tables and join keys the question needs from the schema, then build the answer
+    step by step with CTEs. Use full schema references and appropriate data types.
+    SCHEMA: ## {table_schema} ##
+    QUESTION: ## {question} ##
+    Only return the SQL code.
+    """
+
+# Prompt variants available to speculative strategies ("<variant>@<temperature>")
+SQL_PROMPT_VARIANTS = {"base": INITIAL_SQL_PROMPT, "stepwise": STEPWISE_SQL_PROMPT}
+
+# Race several SQL candidates (prompt variant x temperature) and keep the first that validates
+# "base@0" shares its cache entry with generate_initial_sql; invalid races fall back to the repair loop
+@traced("utils.generate_sql_speculatively")
+def generate_sql_speculatively(question, table_schema, repair_fn=None, **overrides):
+    def generate(strategy):
+        variant, temperature = parse_strategy(strategy)
+        response = run_basic_llm(SQL_PROMPT_VARIANTS[variant], temperature=temperature, question=question, table_schema=table_schema)
+        return extract_code_block(response, 'sql')
+
+    def cost(strategy):
+        template = SQL_PROMPT_VARIANTS.get(parse_strategy(strategy)[0], INITIAL_SQL_PROMPT)
+        return count_tokens(template.format(question=question, table_schema=table_schema))
+
+    return speculative_correct_sql(
+        question, table_schema, generate, read_sql,
+        repair_fn=repair_fn or repair_faulty_sql,
+        extract_fn=lambda response: extract_code_block(response, 'sql'),
+        cost_fn=cost,
+        **overrides
+    )
+
+# Whether the analysis tabs race speculative SQL candidates instead of streaming a single one
+def speculative_enabled() -> bool:
+    return speculative_settings()["enabled"]
 
 # Generate structured business questions
-@st.cache_data
-@st.experimental_fragment
+@traced("utils.generate_analysis_questions")
+@st.cache_data(show_spinner=False)
 def generate_analysis_questions(table_schema):
+    from langchain.output_parsers import ResponseSchema, StructuredOutputParser
     schema = ResponseSchema(
         name="business_questions",
         description="List of relevant business analysis questions based on the schema"
@@ -246,19 +528,37 @@ def generate_analysis_questions(table_schema):
             """
     return run_structured_llm(prompt, parser, table_schema=table_schema)
 
-# Log query to user history
-@st.experimental_fragment
-def log_user_query(user_name, question, query, is_favorite):
-    engine = get_databricks_engine()
-    query_str = f"INSERT INTO hive_metastore.dev_tools.sqlgen_user_query_history VALUES ('{user_name}', current_timestamp(), '{question}', \"{query}\", {is_favorite})"
-    pd.read_sql(query_str, engine)
-
-# Fetch saved queries for user
-@st.cache_data
-def get_user_history(user_name,selected_schema):
-    query = f"""
-    SELECT * FROM hive_metastore.dev_tools.sqlgen_user_query_history
-    WHERE user_name = '{user_name}' AND timestamp > current_date - 20 AND query LIKE '%{selected_schema}%'
-    ORDER BY timestamp DESC
-    """
-    return pd.read_sql(query, get_databricks_engine())
+# Log query to user history (visible locally right away; queued and written to the warehouse in batches)
+@traced("utils.log_user_query")
+def log_user_query(user_name, question, query, is_favorite, catalog=None, schema=None):
+    event = get_history_writer().log(user_name, question, query, is_favorite, catalog, schema)
+    get_history_store().add([event])
+
+# Saved queries for user, served from the local history store and refreshed incrementally
+@traced("utils.get_user_history")
+def get_user_history(user_name, selected_schema, catalog=None):
+    store = get_history_store()
+    if store.needs_refresh(user_name):
+        store.refresh(user_name)
+    return store.rows(user_name, catalog, selected_schema)
+
+# Pull the user's newest saved queries from the warehouse (other users' cached history is untouched)
+@traced("utils.refresh_user_history")
+def refresh_user_history(user_name) -> None:
+    store = get_history_store()
+    store.invalidate(user_name)
+    store.refresh(user_name)
+
+# Queue depth, flush counts and flush latency of the history writer
+def history_writer_metrics() -> dict:
+    return {**get_history_writer().metrics(), **{f"store_{k}": v for k, v in get_history_store().stats().items()}}
+
+# Telemetry snapshot for the debug panel: per-span summary, recent spans and Prometheus text
+def telemetry_snapshot(recent: int = 50) -> dict:
+    telemetry = get_telemetry()
+    return {"summary": telemetry.span_summary(), "recent": telemetry.recent_spans(recent), "prometheus": telemetry.prometheus_text()}
+
+# Pool, cache and history numbers exported as gauges on the metrics endpoint
+get_telemetry().register_gauges("engine", engine_stats)
+get_telemetry().register_gauges("result_cache", result_cache_stats)
+get_telemetry().register_gauges("llm_cache", lambda: get_llm_cache().stats() if get_llm_cache() is not None else {})